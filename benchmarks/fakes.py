@@ -0,0 +1,224 @@
+import io
+import random
+import threading
+import time
+import types
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+from PIL import Image
+
+
+def make_png(width: int = 1344, height: int = 768) -> bytes:
+    """Create a canned PNG roughly the size of a real provider output."""
+    image = Image.effect_noise((width, height), 64).convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class LatencyModel:
+    """Random latency and failures for a fake backend."""
+
+    def __init__(self, latency: float, jitter: float = 0.2, error_rate: float = 0.0):
+        """
+        Args:
+            latency: Mean latency in seconds
+            jitter: Relative spread of the latency (0.2 = +/-20%)
+            error_rate: Probability that a call fails
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def sample(self) -> float:
+        return max(0.0, self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def should_fail(self) -> bool:
+        return random.random() < self.error_rate
+
+
+class FakeAPIError(Exception):
+    """Error with an HTTP status, like the SDK errors the app classifies."""
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+
+class StubImageServer:
+    """
+    Threaded HTTP server serving a canned image at any path, standing in
+    for the Replicate delivery CDN.
+    """
+
+    def __init__(self, image: bytes, latency: LatencyModel):
+        self.image = image
+        self.latency = latency
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                time.sleep(server.latency.sample())
+                if server.latency.should_fail():
+                    self.send_error(503)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(server.image)))
+                self.end_headers()
+                self.wfile.write(server.image)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubImageServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class FakeFileOutput:
+    """Stand-in for replicate.helpers.FileOutput."""
+
+    def __init__(self, url: str):
+        self.url = url
+
+
+class FakePrediction:
+    """Stand-in for replicate.prediction.Prediction."""
+
+    def __init__(self, output_url: str, latency: LatencyModel):
+        self.id = uuid.uuid4().hex
+        self.status = 'starting'
+        self.output = None
+        self.error = None
+        self.logs = ''
+        self.progress = None
+        self._output_url = output_url
+        self._done_at = time.monotonic() + latency.sample()
+        self._fails = latency.should_fail()
+
+    def reload(self) -> None:
+        if self.status in ('succeeded', 'failed', 'canceled'):
+            return
+        if time.monotonic() < self._done_at:
+            self.status = 'processing'
+            self.logs += 'step\n'
+            return
+        if self._fails:
+            self.status = 'failed'
+            self.error = 'Fake model failure'
+        else:
+            self.status = 'succeeded'
+            self.output = self._output_url
+
+    def cancel(self) -> None:
+        if self.status not in ('succeeded', 'failed'):
+            self.status = 'canceled'
+
+
+class FakeReplicateClient:
+    """Stand-in for replicate.Client backed by a StubImageServer."""
+
+    def __init__(self, server: StubImageServer, latency: LatencyModel, api_token: Optional[str] = None):
+        self._server = server
+        self._latency = latency
+        client = self
+
+        class Predictions:
+            def create(self, model: str, input: dict) -> FakePrediction:
+                return FakePrediction(client._output_url(), client._latency)
+
+        class Models:
+            predictions = Predictions()
+
+            def list(self):
+                return []
+
+        self.models = Models()
+
+    def _output_url(self) -> str:
+        return f"{self._server.base_url}/{uuid.uuid4().hex}.png"
+
+    def run(self, model: str, input: dict) -> FakeFileOutput:
+        time.sleep(self._latency.sample())
+        if self._latency.should_fail():
+            raise FakeAPIError("Fake rate limit", 429)
+        return FakeFileOutput(self._output_url())
+
+
+class FakeGeneratedImage:
+    def __init__(self, image_bytes: bytes):
+        self._image_bytes = image_bytes
+
+
+class FakeImageGenerationModel:
+    """Stand-in for vertexai.preview.vision_models.ImageGenerationModel."""
+
+    image = b''
+    latency = LatencyModel(0.0)
+
+    def __init__(self, model_id: str):
+        self._model_id = model_id
+
+    @classmethod
+    def from_pretrained(cls, model_id: str) -> "FakeImageGenerationModel":
+        return cls(model_id)
+
+    def generate_images(self, prompt: str, number_of_images: int = 1, **kwargs):
+        time.sleep(self.latency.sample())
+        if self.latency.should_fail():
+            raise FakeAPIError("Fake quota exhausted", 429)
+        return [FakeGeneratedImage(self.image) for _ in range(number_of_images)]
+
+
+# Local stand-ins for the parts of the Replicate and Vertex AI SDKs the app uses,
+# with configurable latency and error rates, so it can be measured without paid calls
+def install(
+    replicate_latency: LatencyModel, vertex_latency: LatencyModel, download_latency: LatencyModel
+) -> Callable[[], None]:
+    """
+    Make ReplicateClient and VertexClient load the fakes instead of the SDKs.
+
+    Returns:
+        Function that stops the stub image server and restores the real SDK loaders
+    """
+    from api.replicate import ReplicateClient
+    from api.vertex import VertexClient
+
+    loaders = (ReplicateClient.__dict__['load_sdk'], VertexClient.__dict__['load_sdk'])
+    image = make_png()
+    server = StubImageServer(image, download_latency).start()
+
+    replicate_module = types.SimpleNamespace(
+        Client=lambda api_token=None: FakeReplicateClient(server, replicate_latency, api_token)
+    )
+    ReplicateClient.load_sdk = staticmethod(lambda: replicate_module)
+
+    FakeImageGenerationModel.image = image
+    FakeImageGenerationModel.latency = vertex_latency
+    vertexai_module = types.SimpleNamespace(init=lambda **kwargs: None)
+    service_account = types.SimpleNamespace(
+        Credentials=types.SimpleNamespace(from_service_account_info=lambda info: object())
+    )
+    VertexClient.load_sdk = staticmethod(lambda: (vertexai_module, FakeImageGenerationModel, service_account))
+
+    def uninstall() -> None:
+        server.stop()
+        ReplicateClient.load_sdk, VertexClient.load_sdk = loaders
+
+    return uninstall
@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import atexit
+import base64
+import gc
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Fake credentials and limits that never throttle the benchmark; must be set before Config is imported
+os.environ.setdefault('REPLICATE_API_TOKEN', 'benchmark')
+os.environ.setdefault('GOOGLE_PROJECT_ID', 'benchmark')
+os.environ.setdefault('GOOGLE_CREDENTIALS_BASE64', base64.b64encode(b'{}').decode('ascii'))
+os.environ.pop('APP_PASSWORD', None)
+
+# Keep generated images, history and jobs out of the real stores, and leave the ops port free
+DATA_DIR = tempfile.mkdtemp(prefix='tbg-benchmark-')
+atexit.register(shutil.rmtree, DATA_DIR, ignore_errors=True)
+os.environ.setdefault('IMAGE_STORE_DIR', os.path.join(DATA_DIR, 'images'))
+os.environ.setdefault('HISTORY_DB_PATH', os.path.join(DATA_DIR, 'history.sqlite3'))
+os.environ.setdefault('JOB_DB_PATH', os.path.join(DATA_DIR, 'jobs.sqlite3'))
+os.environ.setdefault('OPS_PORT', '0')
+for provider in ('REPLICATE', 'VERTEX'):
+    os.environ.setdefault(f'{provider}_RATE_PER_MINUTE', '1000000')
+    os.environ.setdefault(f'{provider}_BURST', '1000')
+    os.environ.setdefault(f'{provider}_MAX_IN_FLIGHT', '1000')
+
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import LatencyModel, install  # noqa: E402
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """p50 / p95 / p99 of a list of durations."""
+    if not values:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+    values = sorted(values)
+
+    def pick(q: float) -> float:
+        return values[min(len(values) - 1, int(len(values) * q))]
+
+    return {'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99)}
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb() -> float:
+    """Current resident set size of this process in MB, or the peak where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except OSError:
+        return peak_rss_mb()
+    return pages * resource.getpagesize() / (1024 * 1024)
+
+
+def bench_generation(sessions: int, requests_per_session: int) -> Dict[str, Any]:
+    """
+    Drive generation.generate from concurrent sessions, each with its own
+    thread and event loop like Streamlit script runs.
+    """
+    from api.registry import registry
+    from api import generation
+
+    clients = registry.get_clients()
+    targets = [
+        ('replicate', 'black-forest-labs/flux-schnell-lora', {'aspect_ratio': '16:9', 'output_format': 'png'}),
+        ('vertex', 'imagen-3.0-fast-generate-001', {'aspect_ratio': '16:9'})
+    ]
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def session(index: int) -> None:
+        async def run() -> None:
+            nonlocal errors
+            for n in range(requests_per_session):
+                service, model_path, params = targets[(index + n) % len(targets)]
+                start = time.perf_counter()
+                try:
+                    await generation.generate(clients, service, model_path, f"session {index} request {n}", params)
+                    with lock:
+                        latencies.append(time.perf_counter() - start)
+                except Exception:
+                    with lock:
+                        errors += 1
+
+        asyncio.run(run())
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=session, args=(index,)) for index in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_per_min': len(latencies) / elapsed * 60 if elapsed else 0.0,
+        **{f'latency_{name}': value for name, value in percentiles(latencies).items()}
+    }
+
+
+def bench_reruns(sessions: int, reruns: int) -> Dict[str, Any]:
+    """
+    Time Streamlit reruns of the app script with AppTest, one AppTest per
+    session. AppTest installs a process-wide Streamlit runtime for each run,
+    so the sessions take turns instead of running in threads; all of them
+    stay alive, so the memory they hold is measured together.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    def run(app) -> float:
+        start = time.perf_counter()
+        app.run()
+        elapsed = time.perf_counter() - start
+        if app.exception:
+            raise RuntimeError(f"App raised: {app.exception[0].message}")
+        return elapsed
+
+    script = os.path.join(ROOT, 'src', 'main.py')
+    # Load the app's modules first, so they are not counted as memory of the sessions
+    run(AppTest.from_file(script, default_timeout=60))
+
+    gc.collect()
+    rss_before = current_rss_mb()
+    apps = [AppTest.from_file(script, default_timeout=60) for _ in range(sessions)]
+    for app in apps:
+        run(app)
+    timings = [run(app) for _ in range(reruns) for app in apps]
+
+    # Every session is still alive here, so their state is part of the current RSS
+    gc.collect()
+    rss_after = current_rss_mb()
+
+    return {
+        'reruns': len(timings),
+        **{f'rerun_{name}': value for name, value in percentiles(timings).items()},
+        'peak_rss_mb': peak_rss_mb(),
+        'rss_per_session_mb': max(0.0, rss_after - rss_before) / max(1, sessions)
+    }
+
+
+# Metric name -> True when higher is better
+CHECKS = {
+    'throughput_per_min': True,
+    'latency_p95': False,
+    'latency_p99': False,
+    'rerun_p95': False,
+    'rss_per_session_mb': False
+}
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """List the metrics that are worse than the baseline by more than tolerance."""
+    regressions = []
+    for metric, higher_is_better in CHECKS.items():
+        if metric not in results or metric not in baseline or not baseline[metric]:
+            continue
+        value, reference = results[metric], baseline[metric]
+        if higher_is_better and value < reference * (1 - tolerance):
+            regressions.append(f"{metric}: {value:.3f} < baseline {reference:.3f}")
+        if not higher_is_better and value > reference * (1 + tolerance):
+            regressions.append(f"{metric}: {value:.3f} > baseline {reference:.3f}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark with fake Replicate and Vertex AI backends")
+    parser.add_argument('--sessions', type=int, default=8, help="Concurrent simulated sessions")
+    parser.add_argument('--requests', type=int, default=5, help="Generations per session")
+    parser.add_argument('--reruns', type=int, default=20, help="Script reruns per session")
+    parser.add_argument('--replicate-latency', type=float, default=1.0, help="Mean Replicate latency (s)")
+    parser.add_argument('--vertex-latency', type=float, default=1.5, help="Mean Vertex AI latency (s)")
+    parser.add_argument('--download-latency', type=float, default=0.05, help="Mean image download latency (s)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Probability that a fake call fails")
+    parser.add_argument('--skip-reruns', action='store_true', help="Only benchmark the generation path")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed regression against the baseline")
+    parser.add_argument('--update-baseline', action='store_true', help="Store these results as the new baseline")
+    parser.add_argument('--require-baseline', action='store_true',
+                        help="Fail when there is no baseline to compare with, e.g. in CI")
+    args = parser.parse_args()
+
+    uninstall = install(
+        LatencyModel(args.replicate_latency, error_rate=args.error_rate),
+        LatencyModel(args.vertex_latency, error_rate=args.error_rate),
+        LatencyModel(args.download_latency)
+    )
+    try:
+        results = bench_generation(args.sessions, args.requests)
+        if not args.skip_reruns:
+            results.update(bench_reruns(args.sessions, args.reruns))
+    finally:
+        uninstall()
+
+    for metric, value in results.items():
+        print(f"{metric:>22}: {value:.3f}" if isinstance(value, float) else f"{metric:>22}: {value}")
+
+    if args.update_baseline:
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {BASELINE_PATH}")
+        return 0
+
+    if not os.path.exists(BASELINE_PATH):
+        print("No baseline yet, run with --update-baseline to create one")
+        return 1 if args.require_baseline else 0
+
+    with open(BASELINE_PATH, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+from typing import Optional
+
+# HTTP status codes worth retrying: rate limits and transient server errors
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class ProviderError(Exception):
+    """
+    Error raised by a provider client.
+
+    Attributes:
+        retryable: Whether the same request may succeed when retried later
+    """
+
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    """Best-effort HTTP status of an SDK or requests exception."""
+    for attr in ('status', 'status_code', 'code'):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, 'response', None)
+    value = getattr(response, 'status_code', None)
+    return value if isinstance(value, int) else None
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """
+    Check whether an exception from a provider SDK is transient.
+
+    Rate limits (429), timeouts, connection failures and 5xx responses are
+    retryable; invalid input, authentication and content filter errors are not.
+    """
+    if isinstance(error, ProviderError):
+        return error.retryable
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    # httpx / google-api-core errors without a numeric status
+    name = type(error).__name__
+    return name in (
+        'ConnectError', 'ReadTimeout', 'ConnectTimeout', 'RemoteProtocolError',
+        'ResourceExhausted', 'ServiceUnavailable', 'DeadlineExceeded', 'InternalServerError'
+    )
@@ -0,0 +1,231 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from utils.config import Config
+from utils.executor import run_blocking
+from utils.history import history
+from utils.image_store import image_store
+from utils.metrics import BYTES_TRANSFERRED, span, track_provider_call
+from utils.model_stats import model_stats
+from utils.postprocess import process_image
+from utils.result_cache import result_cache
+from utils.scheduler import WaitCallback, call_with_retries, scheduler
+from api.errors import is_retryable_error
+from api.registry import registry
+
+# Called with status messages while a provider call runs
+ProgressCallback = Callable[[str], None]
+
+
+async def _generate_uncached(
+    clients: Dict[str, Any],
+    service: str,
+    model_path: str,
+    prompt: str,
+    params: Dict[str, Any],
+    on_wait: Optional[WaitCallback] = None,
+    on_progress: Optional[ProgressCallback] = None
+) -> List[Dict[str, Any]]:
+    """
+    Call the provider and store its images, returning one entry per image.
+
+    Every attempt waits for an admission slot from the shared scheduler and
+    is recorded in the per-model statistics used for routing. Stored images
+    are added to the history.
+    """
+    async def attempt() -> Dict[str, Any]:
+        async with scheduler.slot(service, on_wait):
+            with track_provider_call(service, model_path):
+                start = time.perf_counter()
+                try:
+                    result = await clients[service].generate_image(
+                        prompt=prompt, model_path=model_path, on_progress=on_progress, **params
+                    )
+                except asyncio.CancelledError:
+                    model_stats.record_censored(service, model_path, time.perf_counter() - start)
+                    raise
+                except Exception:
+                    model_stats.record(service, model_path, time.perf_counter() - start, ok=False)
+                    raise
+                model_stats.record(service, model_path, time.perf_counter() - start, ok=True)
+                return result
+
+    result = await call_with_retries(attempt, is_retryable_error, Config.PROVIDER_MAX_RETRIES)
+    if result.get('status') != 'success':
+        return []
+
+    # Vertex AI always returns PNG
+    format = params.get('output_format', 'png') if service == 'replicate' else 'png'
+
+    images = result.get('images', [])
+    urls = result.get('urls') or [None] * len(images)
+    BYTES_TRANSFERRED.labels('provider').inc(sum(len(image_bytes) for image_bytes in images))
+
+    with span('postprocess', images=len(images)):
+        assets = await asyncio.gather(*(process_image(image_bytes) for image_bytes in images))
+
+    teams_format = Config.POSTPROCESS_FORMAT
+    with span('store', images=len(images)):
+        entries = [{
+            'key': image_store.put(image_bytes, format),
+            'teams_key': image_store.put(background, teams_format),
+            'thumb_key': image_store.put(thumbnail, teams_format),
+            'url': url,
+            'format': format,
+            'teams_format': teams_format,
+            'model_path': model_path,
+            'metadata': result.get('metadata', {}),
+            'service': service
+        } for image_bytes, url, (background, thumbnail) in zip(images, urls, assets)]
+        if Config.HISTORY_ENABLED and entries:
+            await run_blocking(history.add, prompt, params, entries)
+    return entries
+
+
+def _images_available(entries: List[Dict[str, Any]]) -> bool:
+    """Check that every image of a cached result is still in the image store."""
+    return all(
+        image_store.exists(entry[key])
+        for entry in entries
+        for key in ('key', 'teams_key', 'thumb_key')
+    )
+
+
+async def generate(
+    clients: Dict[str, Any],
+    service: str,
+    model_path: str,
+    prompt: str,
+    params: Dict[str, Any],
+    variant: int = 0,
+    on_wait: Optional[WaitCallback] = None,
+    on_progress: Optional[ProgressCallback] = None
+) -> List[Dict[str, Any]]:
+    """
+    Generate images with the given service and keep them in the image store.
+
+    Identical requests are served from the result cache when it is enabled.
+
+    Args:
+        clients: Provider clients keyed by service name
+        service: "replicate" or "vertex"
+        model_path: Full path of the model
+        prompt: The text prompt for image generation
+        params: Remaining keyword arguments for the client's generate_image
+        variant: Index of this call when the same request is sent several times
+        on_wait: Called with queue position and estimated wait while queued
+        on_progress: Called with status messages while the provider call runs
+
+    Returns:
+        List of image entries (key, teams_key, thumb_key, url, format,
+        teams_format, model_path, metadata, service)
+    """
+    if not Config.RESULT_CACHE_ENABLED:
+        return await _generate_uncached(clients, service, model_path, prompt, params, on_wait, on_progress)
+
+    key = result_cache.make_key(service, model_path, prompt, {**params, 'variant': variant})
+    return await result_cache.get_or_compute(
+        key,
+        lambda: _generate_uncached(clients, service, model_path, prompt, params, on_wait, on_progress),
+        is_valid=_images_available
+    )
+
+
+def build_params(service: str, settings: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Adapt generation settings chosen for one service to another service.
+
+    Settings the target service does not support fall back to its defaults.
+
+    Args:
+        service: Target service
+        settings: aspect_ratio, raw, safety_tolerance, image_prompt_strength
+                  and optionally output_format
+    """
+    # Read from the client class, so the client is not built just for its constants
+    supported = registry.client_class(service).SUPPORTED_ASPECT_RATIOS
+    aspect_ratio = settings['aspect_ratio']
+    if aspect_ratio not in supported:
+        aspect_ratio = supported[0]
+
+    params = {
+        'raw': settings['raw'],
+        'aspect_ratio': aspect_ratio,
+        'safety_tolerance': settings['safety_tolerance'],
+        'image_prompt_strength': settings['image_prompt_strength']
+    }
+    if service == 'replicate':
+        params['output_format'] = settings.get('output_format', 'png')
+    return params
+
+
+def expand_calls(
+    targets: List[Tuple[str, str, Dict[str, Any]]],
+    number_of_images: int
+) -> List[Tuple[str, str, Dict[str, Any], int]]:
+    """
+    Turn selected models and a variant count into individual provider calls.
+
+    Vertex AI produces all variants in one call; Replicate gets one call per
+    variant.
+
+    Returns:
+        (service, model_path, params, variant) for each call
+    """
+    calls = []
+    for service, model_path, params in targets:
+        if service == 'vertex':
+            calls.append((service, model_path, {**params, 'number_of_images': number_of_images}, 0))
+        else:
+            calls.extend((service, model_path, params, variant) for variant in range(number_of_images))
+    return calls
+
+
+async def fan_out(
+    clients: Dict[str, Any],
+    targets: List[Tuple[str, str, Dict[str, Any]]],
+    prompt: str,
+    number_of_images: int = 1,
+    on_wait: Optional[WaitCallback] = None,
+    on_progress: Optional[Callable[[str, str], None]] = None
+) -> AsyncIterator[Tuple[str, str, Optional[List[Dict[str, Any]]], Optional[Exception]]]:
+    """
+    Generate number_of_images variants on every target model concurrently.
+
+    Calls to the same provider are capped by Config.PROVIDER_CONCURRENCY.
+    Results are yielded as soon as each call finishes.
+
+    Args:
+        clients: Provider clients keyed by service name
+        targets: (service, model_path, params) for each selected model
+        prompt: The text prompt for image generation
+        number_of_images: Number of variants per model
+        on_wait: Called with queue position and estimated wait while queued
+        on_progress: Called with model path and status message while calls run
+
+    Yields:
+        (service, model_path, entries, error) for each finished call
+    """
+    semaphores = {
+        service: asyncio.Semaphore(Config.PROVIDER_CONCURRENCY.get(service, 1))
+        for service, _, _ in targets
+    }
+    calls = expand_calls(targets, number_of_images)
+
+    async def run(service: str, model_path: str, params: Dict[str, Any], variant: int):
+        async with semaphores[service]:
+            try:
+                progress = (lambda message: on_progress(model_path, message)) if on_progress else None
+                entries = await generate(clients, service, model_path, prompt, params, variant, on_wait, progress)
+                return service, model_path, entries, None
+            except Exception as e:
+                return service, model_path, None, e
+
+    tasks = [asyncio.ensure_future(run(*call)) for call in calls]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
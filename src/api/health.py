@@ -0,0 +1,73 @@
+import threading
+import time
+from typing import Any, Dict, Tuple
+
+from utils.config import Config
+from api.registry import registry
+
+_connection_checks: Dict[str, Tuple[float, Any]] = {}
+_connection_lock = threading.Lock()
+
+
+def check_connection(service: str, client: Any) -> bool:
+    """
+    Result of the client's validate_connection. Passed checks are cached for
+    Config.HEALTH_CHECK_TTL per client; failed ones are repeated on the next probe.
+    """
+    now = time.monotonic()
+    cached = _connection_checks.get(service)
+    if cached is not None and cached[1] is client and now - cached[0] < Config.HEALTH_CHECK_TTL:
+        return True
+
+    with _connection_lock:
+        cached = _connection_checks.get(service)
+        if cached is not None and cached[1] is client and now - cached[0] < Config.HEALTH_CHECK_TTL:
+            return True
+        try:
+            ok = client.validate_connection()
+        except Exception:
+            ok = False
+        if ok:
+            _connection_checks[service] = (time.monotonic(), client)
+        return ok
+
+
+def readiness() -> Tuple[bool, Dict[str, Any]]:
+    """
+    Check whether this process can serve generation requests without cold work.
+
+    Ready means every enabled provider client is loaded (and its model
+    handles warmed), its last connection check passed, and the job queue
+    is not saturated. Clients are never loaded by the check itself.
+
+    Returns:
+        (ready, details per check)
+    """
+    details: Dict[str, Any] = {'providers': {}}
+    ready = True
+
+    try:
+        registry.get_model_info()
+    except EnvironmentError as e:
+        return False, {'error': str(e)}
+    services = registry.stats()['providers']
+
+    for service in services:
+        client = registry.loaded_client(service)
+        loaded = client is not None
+        connected = check_connection(service, client) if loaded else False
+        details['providers'][service] = {'loaded': loaded, 'connected': connected}
+        if loaded and hasattr(client, 'warm_models'):
+            models = client.warm_models()
+            details['providers'][service]['models'] = models
+            loaded = all(models.values())
+        ready = ready and loaded and connected
+
+    if Config.JOB_QUEUE_ENABLED:
+        from utils.jobs import job_queue, QUEUED
+        queued = job_queue.counts().get(QUEUED, 0)
+        saturated = queued >= Config.JOB_QUEUE_MAX_PENDING
+        details['job_queue'] = {'queued': queued, 'saturated': saturated}
+        ready = ready and not saturated
+
+    return ready, details
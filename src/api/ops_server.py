@@ -0,0 +1,174 @@
+import json
+import logging
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+from urllib.parse import parse_qs, quote, urlsplit
+
+from utils.config import Config
+from utils.image_store import image_store
+from utils.metrics import BYTES_TRANSFERRED, register_collectors, render_metrics
+from api.health import readiness
+
+logger = logging.getLogger(__name__)
+
+# Stored images never change under their content-addressed key
+IMAGE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+CONTENT_TYPES = {'jpg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp'}
+
+CHUNK_SIZE = 64 * 1024
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+class OpsHandler(BaseHTTPRequestHandler):
+    """
+    Cheap operational endpoints served next to the Streamlit app:
+
+    /healthz  liveness, always 200 while the process runs
+    /readyz   readiness, 200 when clients are warm and the queue has room, else 503
+    /metrics  Prometheus metrics
+    /images/<key>  stored images, with ETag and Range support; ?download=<name> saves as a file
+    """
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head: bool = False):
+        url = urlsplit(self.path)
+        path = url.path
+        if path.startswith('/images/'):
+            self._send_image(path[len('/images/'):], parse_qs(url.query).get('download', [None])[0], head)
+        elif path == '/healthz':
+            self._send(200, b'ok\n', 'text/plain')
+        elif path == '/readyz':
+            ready, details = readiness()
+            body = json.dumps({'ready': ready, **details}).encode('utf-8')
+            self._send(200 if ready else 503, body, 'application/json')
+        elif path == '/metrics':
+            self._send(200, *render_metrics())
+        else:
+            self._send(404, b'not found\n', 'text/plain')
+
+    def _byte_range(self, size: int) -> Optional[Tuple[int, int]]:
+        """
+        The single byte range requested in the Range header, as (first, last).
+        None means the whole file; a range that cannot be satisfied raises ValueError.
+        """
+        header = self.headers.get('Range')
+        match = re.fullmatch(r'bytes=(\d*)-(\d*)', header.strip()) if header else None
+        if match is None or match.group(1) == match.group(2) == '':
+            # No range, or one we do not support (several ranges): send everything
+            return None
+        if self.headers.get('If-Range') not in (None, self._etag):
+            return None
+
+        first, last = match.groups()
+        if first == '':
+            first, last = max(0, size - int(last)), size - 1
+        else:
+            first, last = int(first), min(size - 1, int(last)) if last else size - 1
+        if first > last or first >= size:
+            raise ValueError(f"Unsatisfiable range: {header}")
+        return first, last
+
+    def _send_image(self, key: str, download_name: Optional[str], head: bool) -> None:
+        try:
+            path = image_store.path(key)
+        except ValueError:
+            path = None
+        if path is None:
+            self._send(404, b'not found\n', 'text/plain')
+            return
+
+        self._etag = f'"{key}"'
+        if self._etag in (tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')):
+            self.send_response(304)
+            self.send_header('ETag', self._etag)
+            self.send_header('Cache-Control', IMAGE_CACHE_CONTROL)
+            self.end_headers()
+            return
+
+        size = os.path.getsize(path)
+        try:
+            byte_range = self._byte_range(size)
+        except ValueError:
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        first, last = byte_range or (0, size - 1)
+
+        self.send_response(206 if byte_range else 200)
+        self.send_header('Content-Type', CONTENT_TYPES.get(key.rsplit('.', 1)[-1], 'application/octet-stream'))
+        self.send_header('Content-Length', str(last - first + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', self._etag)
+        self.send_header('Cache-Control', IMAGE_CACHE_CONTROL)
+        if byte_range:
+            self.send_header('Content-Range', f'bytes {first}-{last}/{size}')
+        if download_name:
+            self.send_header('Content-Disposition', f"attachment; filename*=UTF-8''{quote(download_name)}")
+        self.end_headers()
+        if head:
+            return
+
+        with open(path, 'rb') as f:
+            f.seek(first)
+            remaining = last - first + 1
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+        BYTES_TRANSFERRED.labels('served').inc(last - first + 1 - remaining)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def image_url(key: str, download_name: Optional[str] = None) -> Optional[str]:
+    """
+    Public URL of a stored image on the ops server, or None when the server
+    is not running or IMAGE_BASE_URL is not set.
+
+    Args:
+        key: Image store key
+        download_name: File name the browser saves the image as
+    """
+    if _server is None or not Config.IMAGE_BASE_URL:
+        return None
+    url = f"{Config.IMAGE_BASE_URL.rstrip('/')}/images/{key}"
+    return f"{url}?download={quote(download_name)}" if download_name else url
+
+
+def start() -> None:
+    """Serve the operational endpoints on Config.OPS_PORT, at most once per process."""
+    global _server
+    if Config.OPS_PORT <= 0:
+        return
+    with _server_lock:
+        if _server is not None:
+            return
+        register_collectors()
+        try:
+            _server = ThreadingHTTPServer(('0.0.0.0', Config.OPS_PORT), OpsHandler)
+        except OSError as e:
+            logger.warning("Ops server not started: %s", e)
+            return
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="ops-server", daemon=True).start()
@@ -0,0 +1,249 @@
+import importlib
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from utils.config import Config
+from utils.metrics import CLIENT_INIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Client module and class per provider. Modules are imported on first use
+# and only for providers whose credentials are configured.
+PROVIDERS = {
+    'replicate': ('api.replicate', 'ReplicateClient'),
+    'vertex': ('api.vertex', 'VertexClient')
+}
+
+
+def _client_kwargs(service: str) -> Dict[str, Any]:
+    """Constructor arguments for a provider client, taken from Config."""
+    if service == 'replicate':
+        return {'api_token': Config.REPLICATE_API_TOKEN}
+    return {
+        'project_id': Config.GOOGLE_PROJECT_ID,
+        'credentials_json': Config.get_google_credentials(),
+        'location': Config.GOOGLE_LOCATION
+    }
+
+
+def _client_class(service: str) -> type:
+    module_name, class_name = PROVIDERS[service]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+class _LazyClients(dict):
+    """Client mapping that builds a provider client the first time it is accessed."""
+
+    def __init__(self, registry: "ClientRegistry", services: List[str], clients: Dict[str, Any]):
+        super().__init__(clients)
+        self._registry = registry
+        self._services = services
+
+    def __missing__(self, service: str) -> Any:
+        if service not in self._services:
+            raise KeyError(service)
+        client = self._registry.get_client(service)
+        self[service] = client
+        return client
+
+
+class ClientRegistry:
+    """
+    Process-wide cache of provider clients and model information.
+
+    Streamlit re-executes the app script on every widget interaction, so the
+    clients are built once per worker process and shared by all sessions.
+    Only providers with configured credentials are enabled, and each client
+    (with its SDK) is loaded the first time it is used. The cache is
+    invalidated whenever the provider configuration changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fingerprint: Optional[str] = None
+        self._services: List[str] = []
+        self._clients: Dict[str, Any] = {}
+        self._client_locks = {service: threading.Lock() for service in PROVIDERS}
+        self._model_info: Optional[Dict[str, Dict[str, str]]] = None
+        self._warm_up_thread: Optional[threading.Thread] = None
+
+        # Statistics
+        self.timings: Dict[str, Dict[str, float]] = {}
+        self.builds = 0
+        self.hits = 0
+        self.saved_seconds = 0.0
+
+    @property
+    def build_seconds(self) -> float:
+        """Time it took to load and initialize the clients built so far."""
+        return sum(
+            timing['import_seconds'] + timing['init_seconds']
+            for service, timing in self.timings.items()
+            if service in self._clients
+        )
+
+    def _reset(self, fingerprint: str) -> None:
+        """Enable the configured providers and drop built clients. Must hold the lock."""
+        Config.validate()
+        services = [service for service in PROVIDERS if service in Config.available_providers()]
+
+        all_models = [
+            {"service": service, **model}
+            for service in services
+            for model in _client_class(service).AVAILABLE_MODELS
+        ]
+
+        self._model_info = {
+            f"{model['name']}": {
+                "service": model['service'],
+                "path": model['path'],
+                "description": model['description'],
+                "tier": model['tier']
+            }
+            for model in all_models
+        }
+        self._clients = {}
+        self.timings = {}
+        self._services = services
+        self._fingerprint = fingerprint
+        logger.info("Enabled providers: %s", ", ".join(services))
+
+    def _ensure(self, record: bool = True) -> None:
+        """Make sure the enabled providers match the current configuration."""
+        Config.reload_if_changed()
+        fingerprint = Config.fingerprint()
+
+        # Fast path without locking once the registry is warm
+        if self._fingerprint == fingerprint:
+            if not record or not self._clients:
+                return
+            saved = self.build_seconds
+            self.hits += 1
+            self.saved_seconds += saved
+            logger.debug("Reused provider clients, saved %.3fs (%.3fs total)", saved, self.saved_seconds)
+            return
+
+        with self._lock:
+            if self._fingerprint != fingerprint:
+                self._reset(fingerprint)
+
+    def get_client(self, service: str) -> Any:
+        """
+        Get the shared client for one provider, loading it on first use.
+
+        Raises:
+            KeyError: If the provider is not configured
+        """
+        self._ensure(record=False)
+        if service not in self._services:
+            raise KeyError(service)
+
+        client = self._clients.get(service)
+        if client is not None:
+            return client
+
+        with self._client_locks[service]:
+            client = self._clients.get(service)
+            if client is None:
+                start = time.perf_counter()
+                client_class = _client_class(service)
+                client_class.load_sdk()
+                loaded = time.perf_counter()
+                client = client_class(**_client_kwargs(service))
+                done = time.perf_counter()
+
+                self.timings[service] = {
+                    'import_seconds': loaded - start,
+                    'init_seconds': done - loaded
+                }
+                self._clients[service] = client
+                self.builds += 1
+                CLIENT_INIT_SECONDS.labels(service).observe(done - start)
+                logger.info(
+                    "Loaded %s client in %.3fs (import %.3fs, init %.3fs)",
+                    service, done - start, loaded - start, done - loaded
+                )
+        return client
+
+    def client_class(self, service: str) -> type:
+        """Get the client class of a provider, e.g. for its constants, without loading its SDK or building a client."""
+        return _client_class(service)
+
+    def loaded_client(self, service: str) -> Optional[Any]:
+        """Get the shared client for one provider if it is already loaded, without loading it."""
+        self._ensure(record=False)
+        return self._clients.get(service)
+
+    def get_clients(self) -> Dict[str, Any]:
+        """
+        Get the shared provider clients. Clients not used yet are built on access.
+
+        Raises:
+            EnvironmentError: If no provider is configured
+        """
+        self._ensure()
+        return _LazyClients(self, list(self._services), self._clients)
+
+    def get_model_info(self) -> Dict[str, Dict[str, str]]:
+        """
+        Get the model lookup (display name -> service, path, description, tier)
+        for all enabled providers.
+        """
+        self._ensure(record=False)
+        return self._model_info
+
+    def invalidate(self) -> None:
+        """Drop the cached clients so they are rebuilt on next access."""
+        with self._lock:
+            self._clients = {}
+            self.timings = {}
+            self._model_info = None
+            self._fingerprint = None
+
+    def warm_up(self) -> None:
+        """Load all enabled clients in a background thread, at most once per process."""
+        if not Config.WARM_UP_PROVIDERS:
+            return
+        with self._lock:
+            if self._warm_up_thread is not None:
+                return
+            self._warm_up_thread = threading.Thread(
+                target=self._warm_up, name="client-registry-warm-up", daemon=True
+            )
+            self._warm_up_thread.start()
+
+    def _warm_up(self) -> None:
+        try:
+            self._ensure(record=False)
+        except Exception as e:
+            logger.warning("Client warm-up failed: %s", e)
+            return
+        for service in self._services:
+            try:
+                client = self.get_client(service)
+                if hasattr(client, 'warm_up'):
+                    client.warm_up()
+            except Exception as e:
+                logger.warning("Warm-up of %s client failed: %s", service, e)
+
+    def startup_report(self) -> Dict[str, Dict[str, float]]:
+        """Import and initialization time per loaded provider, in seconds."""
+        return {service: dict(timing) for service, timing in self.timings.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        """Get registry statistics, including time saved by reusing clients."""
+        build_seconds = self.build_seconds
+        return {
+            'providers': list(self._services),
+            'builds': self.builds,
+            'hits': self.hits,
+            'build_seconds': build_seconds,
+            'saved_seconds_per_rerun': build_seconds,
+            'saved_seconds_total': self.saved_seconds
+        }
+
+
+# Shared instance for the whole process
+registry = ClientRegistry()
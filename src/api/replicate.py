@@ -1,45 +1,75 @@
-import replicate
-from typing import Optional, Dict, Any, List
+import asyncio
+import time
+from typing import Optional, Dict, Any, List, Callable
+from utils.config import Config
+from utils.executor import run_blocking
+from utils.http import download_image
+from api.errors import ProviderError, is_retryable_error
 
 class ReplicateClient:
-    # Available Flux models with their full paths
+    # Available Flux models with their full paths, prediction deadlines in seconds
+    # and tiers (models of one tier are interchangeable for routing)
     AVAILABLE_MODELS = [
         {
             "name": "Flux 1.1 Pro",
             "path": "black-forest-labs/flux-1.1-pro",
-            "description": "High quality image generation"
+            "description": "High quality image generation",
+            "timeout": 120,
+            "tier": "quality"
         },
         {
             "name": "Flux Schnell LoRA",
             "path": "black-forest-labs/flux-schnell-lora",
-            "description": "Fast image generation with LoRA"
+            "description": "Fast image generation with LoRA",
+            "timeout": 60,
+            "tier": "fast"
         },
         {
             "name": "Flux 1.1 Pro Ultra",
             "path": "black-forest-labs/flux-1.1-pro-ultra",
-            "description": "Ultra high quality image generation"
+            "description": "Ultra high quality image generation",
+            "timeout": 180,
+            "tier": "quality"
         },
         {
             "name": "Flux Dev LoRA",
             "path": "black-forest-labs/flux-dev-lora",
-            "description": "Development version with LoRA"
+            "description": "Development version with LoRA",
+            "timeout": 120,
+            "tier": "quality"
         },
         {
             "name": "Photon",
             "path": "luma/photon",
-            "description": "High-quality image generation model optimized for creative professional workflows and ultra-high fidelity outputs"
+            "description": "High-quality image generation model optimized for creative professional workflows and ultra-high fidelity outputs",
+            "timeout": 120,
+            "tier": "quality"
         },
         {
             "name": "Ideogram-v2",
             "path": "ideogram-ai/ideogram-v2",
-            "description": "An excellent image model with state of the art inpainting, prompt comprehension and text rendering"
-        }  
+            "description": "An excellent image model with state of the art inpainting, prompt comprehension and text rendering",
+            "timeout": 120,
+            "tier": "quality"
+        }
     ]
 
+    # Aspect ratios supported by all Flux models
+    SUPPORTED_ASPECT_RATIOS = ["16:9", "3:2", "1:1", "2:3"]
+
+    @staticmethod
+    def load_sdk():
+        """
+        Import the Replicate SDK. Deferred so the app starts without it.
+        """
+        import replicate
+        return replicate
+
     def __init__(self, api_token: Optional[str] = None):
         """
         Initialize the Replicate client.
         """
+        replicate = self.load_sdk()
         self.client = replicate.Client(api_token=api_token)
         
     def get_available_models(self) -> List[Dict[str, str]]:
@@ -50,7 +80,8 @@ class ReplicateClient:
             {
                 "name": model["name"],
                 "path": model["path"],
-                "description": model["description"]
+                "description": model["description"],
+                "tier": model["tier"]
             }
             for model in self.AVAILABLE_MODELS
         ]
@@ -63,10 +94,15 @@ class ReplicateClient:
         aspect_ratio: str = "3:2",
         output_format: str = "jpg",
         safety_tolerance: int = 2,
-        image_prompt_strength: float = 0.1
+        image_prompt_strength: float = 0.1,
+        on_progress: Optional[Callable[[str], None]] = None
     ) -> Dict[str, Any]:
         """
         Generate images using Replicate's Flux models.
+
+        In "predictions" mode (Config.REPLICATE_MODE) a prediction is created
+        and polled, so progress can be reported and the prediction is canceled
+        when it exceeds the model's deadline or the caller goes away.
         
         Args:
             prompt (str): The text prompt for image generation
@@ -76,43 +112,113 @@ class ReplicateClient:
             output_format (str): Output format
             safety_tolerance (int): Safety filter level
             image_prompt_strength (float): Strength of the image prompt
+            on_progress (callable): Called with status messages while the prediction runs
         """
+        model_input = {
+            "prompt": prompt,
+            "raw": raw,
+            "aspect_ratio": aspect_ratio,
+            "output_format": output_format,
+            "safety_tolerance": safety_tolerance,
+            "image_prompt_strength": image_prompt_strength
+        }
+
         try:
-            output = self.client.run(
-                model_path,
-                input={
-                    "prompt": prompt,
-                    "raw": raw,
-                    "aspect_ratio": aspect_ratio,
-                    "output_format": output_format,
-                    "safety_tolerance": safety_tolerance,
-                    "image_prompt_strength": image_prompt_strength
-                }
-            )
+            if Config.REPLICATE_MODE == 'predictions':
+                output = await self._run_prediction(model_path, model_input, on_progress)
+            else:
+                output = await run_blocking(self.client.run, model_path, input=model_input)
             
-            # Convert FileOutput to URL string
-            if hasattr(output, 'url'):
+            # Convert FileOutput (run) or plain URLs (predictions) to URL strings
+            if isinstance(output, str):
+                urls = [output]
+            elif hasattr(output, 'url'):
                 urls = [output.url]
-            elif isinstance(output, list) and all(hasattr(item, 'url') for item in output):
-                urls = [item.url for item in output]
+            elif isinstance(output, list) and all(isinstance(item, str) or hasattr(item, 'url') for item in output):
+                urls = [item if isinstance(item, str) else item.url for item in output]
             else:
                 raise Exception(f"Unexpected output format")
-            
-            return {
-                'status': 'success',
-                'urls': urls,
-                'model_path': model_path,
-                'metadata': {
-                    'prompt': prompt,
-                    'aspect_ratio': aspect_ratio,
-                    'output_format': output_format,
-                    'safety_tolerance': safety_tolerance,
-                    'image_prompt_strength': image_prompt_strength
-                }
-            }
-            
         except Exception as e:
-            raise Exception(f"Replicate API error: {str(e)}")
+            raise ProviderError(f"Replicate API error: {str(e)}", retryable=is_retryable_error(e))
+
+        # Fetch the outputs once, while the provider URLs are fresh. download_image retries
+        # network failures itself; retrying the generation would pay for the images again.
+        try:
+            images = await asyncio.gather(*(run_blocking(download_image, url) for url in urls))
+        except Exception as e:
+            raise ProviderError(f"Downloading the generated image failed: {str(e)}", retryable=False)
+
+        return {
+            'status': 'success',
+            'urls': urls,
+            # Raw image bytes of each output, in the requested format
+            'images': list(images),
+            'model_path': model_path,
+            'metadata': {
+                'prompt': prompt,
+                'aspect_ratio': aspect_ratio,
+                'output_format': output_format,
+                'safety_tolerance': safety_tolerance,
+                'image_prompt_strength': image_prompt_strength
+            }
+        }
+
+    def get_timeout(self, model_path: str) -> float:
+        """
+        Get the prediction deadline for a model in seconds.
+        """
+        for model in self.AVAILABLE_MODELS:
+            if model["path"] == model_path:
+                return model.get("timeout", Config.REPLICATE_PREDICTION_TIMEOUT)
+        return Config.REPLICATE_PREDICTION_TIMEOUT
+
+    async def _run_prediction(
+        self,
+        model_path: str,
+        model_input: Dict[str, Any],
+        on_progress: Optional[Callable[[str], None]] = None
+    ) -> Any:
+        """
+        Create a prediction and poll it until it finishes.
+
+        Polling starts fast and backs off, since most of the time is spent
+        waiting for the GPU. The prediction is canceled when the deadline
+        passes or when polling is interrupted (task cancellation or an
+        exception raised by on_progress, e.g. when the Streamlit session
+        reruns), so abandoned requests stop using paid GPU time.
+        """
+        prediction = await run_blocking(self.client.models.predictions.create, model=model_path, input=model_input)
+        deadline = time.monotonic() + self.get_timeout(model_path)
+        interval = Config.REPLICATE_POLL_MIN_SECONDS
+
+        try:
+            while prediction.status not in ("succeeded", "failed", "canceled"):
+                if time.monotonic() > deadline:
+                    # Not a TimeoutError: retrying would pay for the same slow prediction again
+                    raise Exception(f"Prediction {prediction.id} exceeded {self.get_timeout(model_path):.0f}s")
+
+                if on_progress is not None:
+                    progress = getattr(prediction, 'progress', None)
+                    if progress is not None and getattr(progress, 'percentage', None) is not None:
+                        on_progress(f"{prediction.status} ({progress.percentage:.0%})")
+                    else:
+                        last_log = (prediction.logs or "").strip().splitlines()[-1:]
+                        on_progress(f"{prediction.status}: {last_log[0]}" if last_log else prediction.status)
+
+                await asyncio.sleep(interval)
+                interval = min(interval * 1.5, Config.REPLICATE_POLL_MAX_SECONDS)
+                await run_blocking(prediction.reload)
+        except BaseException:
+            # Do not wait for the cancel request when the task itself is being cancelled
+            try:
+                await asyncio.shield(run_blocking(prediction.cancel))
+            except BaseException:
+                pass
+            raise
+
+        if prediction.status != "succeeded":
+            raise Exception(f"Prediction {prediction.status}: {prediction.error}")
+        return prediction.output
 
     def validate_connection(self) -> bool:
         """
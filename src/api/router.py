@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from utils.config import Config
+from utils.model_stats import model_stats
+from utils.scheduler import WaitCallback
+from api.registry import registry
+from api import generation
+
+logger = logging.getLogger(__name__)
+
+# Routing tiers offered in the UI, fastest first
+TIERS = ["fast", "quality"]
+
+
+def candidates(tier: str) -> List[Tuple[str, str]]:
+    """
+    Enabled models of a tier, best first by expected time to a successful result.
+
+    Returns:
+        (service, model_path) for each model
+    """
+    models = [
+        (model['service'], model['path'])
+        for model in registry.get_model_info().values()
+        if model['tier'] == tier
+    ]
+    return sorted(models, key=lambda model: model_stats.expected_seconds(*model))
+
+
+def hedge_delay(service: str, model_path: str) -> float:
+    """Time to wait for a model before sending a hedged request: its p95 latency."""
+    p95 = model_stats.percentile(service, model_path, 0.95)
+    return Config.HEDGE_DEFAULT_SECONDS if p95 is None else p95
+
+
+async def generate_fastest(
+    clients: Dict[str, Any],
+    tier: str,
+    prompt: str,
+    settings: Dict[str, Any],
+    variant: int = 0,
+    on_wait: Optional[WaitCallback] = None,
+    on_progress: Optional[Callable[[str, str], None]] = None
+) -> Tuple[str, str, List[Dict[str, Any]]]:
+    """
+    Generate one image on the best model of a tier.
+
+    The request goes to the model with the lowest expected latency. If that
+    model fails, the next candidate is tried. If it is still running after
+    its p95 latency, a hedged request is sent to the next candidate; the first
+    successful result wins and the other call is cancelled.
+
+    Args:
+        clients: Provider clients keyed by service name
+        tier: Model tier, see TIERS
+        prompt: The text prompt for image generation
+        settings: Generation settings, adapted to each model with build_params
+        variant: Index of this call when the same request is sent several times
+        on_wait: Called with queue position and estimated wait while queued
+        on_progress: Called with model path and status message while calls run
+
+    Returns:
+        (service, model_path, entries) of the model that answered first
+    """
+    remaining = candidates(tier)
+    if not remaining:
+        raise ValueError(f"No models available for the {tier} tier")
+
+    running: Dict[asyncio.Future, Tuple[str, str]] = {}
+
+    def launch() -> Tuple[str, str]:
+        service, model_path = remaining.pop(0)
+        params = generation.build_params(service, settings)
+        progress = (lambda message: on_progress(model_path, message)) if on_progress else None
+        task = asyncio.ensure_future(
+            generation.generate(clients, service, model_path, prompt, params, variant, on_wait, progress)
+        )
+        running[task] = (service, model_path)
+        return service, model_path
+
+    last_error: Optional[Exception] = None
+    primary = launch()
+    hedge_at = time.monotonic() + hedge_delay(*primary)
+    try:
+        while running:
+            timeout = None
+            if Config.HEDGE_ENABLED and remaining and hedge_at is not None:
+                timeout = max(0.0, hedge_at - time.monotonic())
+
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                logger.info("%s passed its p95, hedging on %s", primary[1], remaining[0][1])
+                launch()
+                hedge_at = None
+                continue
+
+            for task in done:
+                service, model_path = running.pop(task)
+                try:
+                    entries = task.result()
+                except Exception as e:
+                    logger.warning("%s failed: %s", model_path, e)
+                    last_error = e
+                    continue
+                if entries:
+                    return service, model_path, entries
+
+            # Fail over once every running call has failed
+            if not running and remaining:
+                primary = launch()
+                hedge_at = time.monotonic() + hedge_delay(*primary)
+    finally:
+        for task in running:
+            task.cancel()
+
+    if last_error is not None:
+        raise last_error
+    raise RuntimeError(f"No model of the {tier} tier returned an image")
+
+
+async def fan_out(
+    clients: Dict[str, Any],
+    tier: str,
+    prompt: str,
+    settings: Dict[str, Any],
+    number_of_images: int = 1,
+    on_wait: Optional[WaitCallback] = None,
+    on_progress: Optional[Callable[[str, str], None]] = None
+) -> AsyncIterator[Tuple[str, str, Optional[List[Dict[str, Any]]], Optional[Exception]]]:
+    """
+    Generate number_of_images variants on the fastest models of a tier,
+    each routed on its own.
+
+    Yields:
+        (service, model_path, entries, error) for each finished variant, like
+        generation.fan_out; failed variants carry the tier as model path
+    """
+    async def run(variant: int):
+        try:
+            service, model_path, entries = await generate_fastest(
+                clients, tier, prompt, settings, variant, on_wait, on_progress
+            )
+            return service, model_path, entries, None
+        except Exception as e:
+            return None, f"{tier} tier", None, e
+
+    tasks = [asyncio.ensure_future(run(variant)) for variant in range(number_of_images)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -1,25 +1,43 @@
-from vertexai.preview.vision_models import ImageGenerationModel
-from typing import Dict, Any, List
-import base64
+from typing import Dict, Any, List, Optional, Callable, TYPE_CHECKING
 import json
-from google.oauth2 import service_account  # Add this import
-import vertexai
+import threading
+from utils.executor import run_blocking
+from api.errors import ProviderError, is_retryable_error
+
+if TYPE_CHECKING:
+    from vertexai.preview.vision_models import ImageGenerationModel
 
 class VertexClient:
-    # Available Imagen models
+    # Available Imagen models and their routing tiers
     AVAILABLE_MODELS = [
         {
             "name": "Imagen 3",
             "path": "imagen-3.0-generate-001",
-            "description": "High quality image generation"
+            "description": "High quality image generation",
+            "tier": "quality"
         },
         {
             "name": "Imagen 3 Fast",
             "path": "imagen-3.0-fast-generate-001",
-            "description": "Fast image generation"
+            "description": "Fast image generation",
+            "tier": "fast"
         }
     ]
 
+    # Aspect ratios supported by Imagen
+    SUPPORTED_ASPECT_RATIOS = ["16:9", "1:1", "9:16", "4:3", "3:4"]
+
+    @staticmethod
+    def load_sdk():
+        """
+        Import the Vertex AI SDK. Its import tree is large, so it is only
+        loaded when a Vertex client is created.
+        """
+        import vertexai
+        from vertexai.preview.vision_models import ImageGenerationModel
+        from google.oauth2 import service_account
+        return vertexai, ImageGenerationModel, service_account
+
     def __init__(self, project_id: str, credentials_json: str, location: str = "us-central1"):
         """
         Initialize the Vertex AI client.
@@ -29,7 +47,8 @@ class VertexClient:
             credentials_json: JSON credentials as string
             location: Google Cloud location
         """
-        
+        vertexai, self._model_class, service_account = self.load_sdk()
+
         # Create temporary credentials file
         credentials_dict = json.loads(credentials_json)
         credentials = service_account.Credentials.from_service_account_info(credentials_dict)
@@ -37,7 +56,40 @@ class VertexClient:
         vertexai.init(project=project_id, location=location, credentials=credentials)
         self.project_id = project_id
         self.location = location
-        self.model = ImageGenerationModel.from_pretrained("imagen-3.0-generate-001")
+
+        # Loaded model handles keyed by model path, shared by all sessions
+        self._models: Dict[str, "ImageGenerationModel"] = {}
+        self._model_locks = {model["path"]: threading.Lock() for model in self.AVAILABLE_MODELS}
+        self._get_model(self.AVAILABLE_MODELS[0]["path"])
+
+    def _get_model(self, model_path: str) -> "ImageGenerationModel":
+        """
+        Get the model handle for model_path, loading it on first use.
+        """
+        model = self._models.get(model_path)
+        if model is not None:
+            return model
+
+        lock = self._model_locks.setdefault(model_path, threading.Lock())
+        with lock:
+            model = self._models.get(model_path)
+            if model is None:
+                model = self._model_class.from_pretrained(model_path)
+                self._models[model_path] = model
+        return model
+
+    def warm_up(self) -> None:
+        """
+        Load handles for all available models.
+        """
+        for model in self.AVAILABLE_MODELS:
+            self._get_model(model["path"])
+
+    def warm_models(self) -> Dict[str, bool]:
+        """
+        Whether the handle of each available model is loaded, keyed by model path.
+        """
+        return {model["path"]: model["path"] in self._models for model in self.AVAILABLE_MODELS}
 
     def get_available_models(self) -> List[Dict[str, str]]:
         """
@@ -47,7 +99,8 @@ class VertexClient:
             {
                 "name": model["name"],
                 "path": model["path"],
-                "description": model["description"]
+                "description": model["description"],
+                "tier": model["tier"]
             }
             for model in self.AVAILABLE_MODELS
         ]
@@ -60,7 +113,8 @@ class VertexClient:
         aspect_ratio: str = "1:1",
         safety_tolerance: int = 1,
         image_prompt_strength: float = 0.1,
-        number_of_images: int = 1
+        number_of_images: int = 1,
+        on_progress: Optional[Callable[[str], None]] = None
     ) -> Dict[str, Any]:
         """
         Generate images using Vertex AI's Imagen model.
@@ -73,14 +127,16 @@ class VertexClient:
             safety_tolerance (int): Not used - fixed to block_only_high
             image_prompt_strength (float): Not used in Vertex AI
             number_of_images (int): Number of images to generate (1-8 for imagen-3.0, 1-4 for others)
+            on_progress (callable): Not used - Imagen does not report progress
         """
         try:
-            # Update model if different from current
-            if model_path != self.model._model_id:
-                self.model = ImageGenerationModel.from_pretrained(model_path)
+            model = self._models.get(model_path)
+            if model is None:
+                model = await run_blocking(self._get_model, model_path)
 
             # Generate the images
-            images = self.model.generate_images(
+            images = await run_blocking(
+                model.generate_images,
                 prompt=prompt,
                 number_of_images=number_of_images,
                 language="en",
@@ -88,19 +144,11 @@ class VertexClient:
                 safety_filter_level="block_only_high"
             )
 
-            # Process and store the images
-            urls = []
-            
-            # Convert and process each generated image
-            for generated_image in images:
-                # Access the image bytes directly
-                image_bytes = generated_image._image_bytes
-                base64_image = base64.b64encode(image_bytes).decode('utf-8')
-                urls.append(f"data:image/png;base64,{base64_image}")
-
             return {
                 'status': 'success',
-                'urls': urls,
+                'urls': [],
+                # Raw PNG bytes of each generated image
+                'images': [generated_image._image_bytes for generated_image in images],
                 'model_path': model_path,
                 'metadata': {
                     'prompt': prompt,
@@ -113,13 +161,13 @@ class VertexClient:
             }
 
         except Exception as e:
-            raise Exception(f"Vertex AI API error: {str(e)}")
+            raise ProviderError(f"Vertex AI API error: {str(e)}", retryable=is_retryable_error(e))
 
     def validate_connection(self) -> bool:
         """
         Validate the connection to Vertex AI.
+
+        Model handles are loaded from the Vertex AI API, so the connection
+        counts as working once every available model's handle is loaded.
         """
-        try:
-            return self.model is not None
-        except Exception:
-            return False
+        return all(self.warm_models().values())
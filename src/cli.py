@@ -0,0 +1,230 @@
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import shutil
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+
+from utils.config import Config
+from utils.image_store import image_store
+from api.registry import registry
+from api import generation
+
+# Manifest columns used as generation settings
+SETTING_FIELDS = {
+    'aspect_ratio': str,
+    'output_format': str,
+    'raw': lambda value: str(value).lower() in ('1', 'true', 'yes'),
+    'safety_tolerance': int,
+    'image_prompt_strength': float,
+    'number_of_images': int
+}
+
+DEFAULT_SETTINGS = {
+    'aspect_ratio': '16:9',
+    'output_format': 'png',
+    'raw': False,
+    'safety_tolerance': 2,
+    'image_prompt_strength': 0.1,
+    'number_of_images': 1
+}
+
+
+def load_manifest(path: str) -> List[Dict[str, Any]]:
+    """
+    Load jobs from a JSONL or CSV manifest.
+
+    Each job needs a prompt and a model (display name or model path). An id,
+    the generation settings and number_of_images are optional.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.csv'):
+            rows = [row for row in csv.DictReader(f)]
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    jobs = []
+    for row in rows:
+        if not row.get('prompt') or not row.get('model'):
+            raise ValueError(f"Manifest entry needs 'prompt' and 'model': {row}")
+
+        settings = dict(DEFAULT_SETTINGS)
+        for field, convert in SETTING_FIELDS.items():
+            if row.get(field) not in (None, ''):
+                settings[field] = convert(row[field])
+
+        job_id = row.get('id') or hashlib.sha256(
+            json.dumps([row['prompt'], row['model'], settings], sort_keys=True).encode('utf-8')
+        ).hexdigest()[:16]
+        jobs.append({'id': str(job_id), 'prompt': row['prompt'], 'model': row['model'], 'settings': settings})
+    return jobs
+
+
+def resolve_model(model_info: Dict[str, Dict[str, str]], model: str) -> Dict[str, str]:
+    """Find a model by display name or model path."""
+    if model in model_info:
+        return model_info[model]
+    for info in model_info.values():
+        if info['path'] == model:
+            return info
+    raise ValueError(f"Unknown model: {model}")
+
+
+def load_checkpoint(index_path: str) -> set:
+    """Get ids of jobs already completed in a previous run."""
+    if not os.path.exists(index_path):
+        return set()
+    done = set()
+    with open(index_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)['id'])
+            except (ValueError, KeyError):
+                # Ignore a line truncated by a crash
+                continue
+    return done
+
+
+async def run_batch(args: argparse.Namespace) -> int:
+    """Run all jobs from the manifest and write their outputs."""
+    jobs = load_manifest(args.manifest)
+    os.makedirs(args.output, exist_ok=True)
+    index_path = os.path.join(args.output, 'index.jsonl')
+    done = load_checkpoint(index_path)
+    pending = [job for job in jobs if job['id'] not in done]
+    print(f"{len(jobs)} jobs, {len(done)} already done, {len(pending)} to run", file=sys.stderr)
+
+    clients = registry.get_clients()
+    model_info = registry.get_model_info()
+
+    # Fail before any paid call if a job names an unknown model
+    for job in pending:
+        resolve_model(model_info, job['model'])
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    provider_semaphores = {
+        service: asyncio.Semaphore(limit) for service, limit in Config.PROVIDER_CONCURRENCY.items()
+    }
+    latencies: Dict[str, List[float]] = {}
+    image_count = 0
+    failures = 0
+
+    with open(index_path, 'a', encoding='utf-8') as index_file:
+
+        async def run_job(job: Dict[str, Any]) -> None:
+            nonlocal image_count, failures
+            model = resolve_model(model_info, job['model'])
+            service = model['service']
+            settings = dict(job['settings'])
+            number_of_images = settings.pop('number_of_images')
+            params = generation.build_params(service, settings)
+
+            async with semaphore, provider_semaphores[service]:
+                start = time.perf_counter()
+                try:
+                    if service == 'vertex':
+                        calls = [generation.generate(
+                            clients, service, model['path'], job['prompt'],
+                            {**params, 'number_of_images': number_of_images}
+                        )]
+                    else:
+                        calls = [
+                            generation.generate(clients, service, model['path'], job['prompt'], params, variant)
+                            for variant in range(number_of_images)
+                        ]
+                    entries = [entry for result in await asyncio.gather(*calls) for entry in result]
+                except Exception as e:
+                    failures += 1
+                    print(f"Job {job['id']} failed: {e}", file=sys.stderr)
+                    return
+                latencies.setdefault(service, []).append(time.perf_counter() - start)
+
+            files = []
+            for n, entry in enumerate(entries, start=1):
+                # Original output, Teams-ready background and its thumbnail
+                outputs = {
+                    f"{job['id']}_{n}.{entry['format']}": entry['key'],
+                    f"{job['id']}_{n}_teams.{entry['teams_format']}": entry['teams_key'],
+                    f"{job['id']}_{n}_teams_thumb.{entry['teams_format']}": entry['thumb_key']
+                }
+                for file_name, key in outputs.items():
+                    shutil.copyfile(image_store.path(key), os.path.join(args.output, file_name))
+                files.append(list(outputs))
+            image_count += len(files)
+
+            # One line per finished job doubles as the resume checkpoint
+            index_file.write(json.dumps({
+                'id': job['id'],
+                'prompt': job['prompt'],
+                'model': model['path'],
+                'service': service,
+                'settings': job['settings'],
+                'files': files,
+                'metadata': entries[0]['metadata'] if entries else {},
+                'completed_at': time.time()
+            }) + '\n')
+            index_file.flush()
+            print(f"Job {job['id']} done ({len(files)} images)", file=sys.stderr)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(run_job(job) for job in pending))
+        elapsed = time.perf_counter() - start
+
+    # Summary
+    print(f"\n{image_count} images in {elapsed:.1f}s "
+          f"({image_count / elapsed * 60 if elapsed else 0:.1f} images/min), {failures} failed jobs")
+    for service, values in sorted(latencies.items()):
+        values = sorted(values)
+        p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+        print(f"{service}: {len(values)} jobs, mean {statistics.mean(values):.2f}s, "
+              f"p50 {statistics.median(values):.2f}s, p95 {p95:.2f}s")
+
+    return 1 if failures else 0
+
+
+def startup_report() -> int:
+    """Load every configured provider and print how long each one takes."""
+    start = time.perf_counter()
+    model_info = registry.get_model_info()
+    print(f"Model catalog: {len(model_info)} models in {time.perf_counter() - start:.3f}s")
+
+    for service in Config.available_providers():
+        registry.get_client(service)
+    for service, timing in registry.startup_report().items():
+        print(f"{service}: import {timing['import_seconds']:.3f}s, init {timing['init_seconds']:.3f}s")
+
+    missing = [service for service in Config.PROVIDER_REQUIREMENTS if service not in Config.available_providers()]
+    if missing:
+        print(f"Not configured: {', '.join(missing)}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Generate Teams backgrounds in bulk")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    batch = subparsers.add_parser('batch', help="Run jobs from a JSONL or CSV manifest")
+    batch.add_argument('manifest', help="Path to the .jsonl or .csv manifest")
+    batch.add_argument('--output', '-o', required=True, help="Directory for images and index.jsonl")
+    batch.add_argument('--concurrency', '-c', type=int, default=4, help="Maximum jobs running at once")
+
+    subparsers.add_parser('startup', help="Report import and initialization time per provider")
+
+    args = parser.parse_args()
+    try:
+        if args.command == 'batch':
+            return asyncio.run(run_batch(args))
+        if args.command == 'startup':
+            return startup_report()
+    except (EnvironmentError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
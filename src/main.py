@@ -1,10 +1,19 @@
 import streamlit as st
 import asyncio
+import math
+import os
 from utils.config import Config
-from api.replicate import ReplicateClient
-from api.vertex import VertexClient
-import requests
-import base64
+from api.registry import registry
+from api import generation
+from api import router
+from api.errors import ProviderError
+from api import ops_server
+from utils.image_store import image_store
+from utils.history import history
+from utils.similarity import find_similar, prompt_index
+from utils.jobs import job_queue, QUEUED, RUNNING, DONE
+from utils import metrics
+from worker import start_worker_pool
 
 # Initialize session state
 if 'generated_images' not in st.session_state:
@@ -14,53 +23,258 @@ if 'selected_service' not in st.session_state:
 if 'model_info' not in st.session_state:
     st.session_state.model_info = {}
 
+if 'job_ids' not in st.session_state:
+    # Reattach jobs submitted before a reload or dropped connection
+    jobs_param = st.query_params.get('jobs')
+    st.session_state.job_ids = jobs_param.split(',') if jobs_param else []
+if 'job_errors' not in st.session_state:
+    st.session_state.job_errors = []
+if 'history_page' not in st.session_state:
+    st.session_state.history_page = 0
+if 'similar_images' not in st.session_state:
+    st.session_state.similar_images = []
+    # Form submission held back while similar stored images are offered
+    st.session_state.pending_submission = None
+if 'draft' not in st.session_state:
+    # Prompt and settings of the current drafts, while they can be refined
+    st.session_state.draft = None
+    st.session_state.refine_requested = False
+
+# Build provider clients in the background as soon as the worker starts
+registry.warm_up()
+ops_server.start()
+if Config.HISTORY_ENABLED and Config.SIMILARITY_ENABLED:
+    prompt_index.warm_up()
+
+# Serve the durable job queue from separate worker processes
+if Config.JOB_QUEUE_ENABLED and Config.JOB_WORKERS > 0:
+    start_worker_pool(Config.JOB_WORKERS, Config.JOB_WORKER_CONCURRENCY)
+
 def initialize_clients():
-    """Initialize both Replicate and Vertex AI clients using Config."""
-    clients = {}
-    
+    """Get the shared clients of all configured providers from the process-wide registry."""
     try:
-        Config.validate()
-        clients['replicate'] = ReplicateClient(api_token=Config.REPLICATE_API_TOKEN)
-        
-        # Get credentials JSON from base64
-        credentials_json = Config.get_google_credentials()
-        
-        clients['vertex'] = VertexClient(
-            project_id=Config.GOOGLE_PROJECT_ID,
-            credentials_json=credentials_json,
-            location=Config.GOOGLE_LOCATION
-        )
-        return clients
+        return registry.get_clients()
     except EnvironmentError as e:
         st.error(f"Configuration Error: {str(e)}")
         return None
 
-def initialize_models(clients):
-    """Initialize model information from all services."""
-    replicate_models = clients['replicate'].get_available_models()
-    vertex_models = clients['vertex'].get_available_models()
+def initialize_models():
+    """Get model information from all services."""
+    return registry.get_model_info()
+
+def mime_type(format: str) -> str:
+    """Get the MIME type for an image file extension"""
+    return "image/jpeg" if format == "jpg" else f"image/{format}"
+
+def image_source(key: str):
+    """
+    Where the browser loads a stored image from: its URL on the ops server, so it
+    is fetched once and cached, or the file itself. None if it has been evicted.
+    """
+    if not image_store.exists(key):
+        return None
+    return ops_server.image_url(key) or image_store.path(key)
+
+# Download buttons per stored image: (key field, format field, file name suffix, label, help)
+DOWNLOADS = {
+    'teams': ('teams_key', 'teams_format', '', "Download for Teams",
+              "Click to download the image for use in Teams, center-cropped to 1920x1080"),
+    'thumbnail': ('thumb_key', 'teams_format', '_thumb', "Download thumbnail",
+                  "Thumbnail shown in the Teams background picker"),
+    'original': ('key', 'format', '_original', "Download original",
+                 "The image as generated, in the chosen aspect ratio and format")
+}
+
+def render_download_button(idx: int, image_data: dict, kind: str = 'teams'):
+    """Render the download button for a Teams-ready background, its thumbnail or the original image"""
+    key_field, format_field, suffix, label, help = DOWNLOADS[kind]
+    key = image_data[key_field]
+    if not image_store.exists(key):
+        return
+    file_name = f"teams_background_{idx+1}{suffix}.{image_data[format_field]}"
+
+    # Link to the ops server, so the bytes are only transferred when clicked
+    url = ops_server.image_url(key, file_name)
+    if url is not None:
+        st.link_button(label, url, help=help)
+        return
+
+    # Otherwise stream the file from the image store into the page
+    path = image_store.path(key)
+    metrics.BYTES_TRANSFERRED.labels('served').inc(os.path.getsize(path))
+    with open(path, 'rb') as image_file:
+        st.download_button(
+            label=label,
+            data=image_file,
+            file_name=file_name,
+            mime=mime_type(image_data[format_field]),
+            help=help,
+            key=f"download_{kind}_{idx}"
+        )
+
+@st.fragment(run_every=Config.JOB_POLL_SECONDS * 2)
+def render_job_status():
+    """Poll the job queue and collect results once all submitted jobs have finished"""
+    jobs = job_queue.get(st.session_state.job_ids)
+    pending = [job for job in jobs if job['status'] in (QUEUED, RUNNING)]
+
+    if pending:
+        for job in pending:
+            if job['status'] == QUEUED:
+                st.info(f"{job['model_path']}: waiting in queue (position {job_queue.position(job)})")
+            else:
+                st.info(f"{job['model_path']}: generating...")
+        return
 
-    # Combine models with service identifier
-    all_models = (
-        [{"service": "replicate", **model} for model in replicate_models] +
-        [{"service": "vertex", **model} for model in vertex_models]
+    st.session_state.generated_images = [
+        entry for job in jobs if job['status'] == DONE for entry in job['result']
+    ]
+    st.session_state.job_errors = [
+        f"{job['model_path']} is busy right now, please try again in a moment." if job['retryable']
+        else f"Error ({job['model_path']}): {job['error']}"
+        for job in jobs if job['status'] != DONE
+    ]
+    st.session_state.job_ids = []
+    # Results are collected; a later reload must not reattach these jobs
+    st.query_params.pop('jobs', None)
+    st.rerun()
+
+def detach_jobs():
+    """Stop waiting for submitted jobs; queued ones are cancelled, running ones finish unseen"""
+    job_queue.cancel(st.session_state.job_ids)
+    st.session_state.job_ids = []
+    st.session_state.job_errors = []
+    st.query_params.pop('jobs', None)
+
+def render_similar_images() -> bool:
+    """
+    Offer stored images with similar prompts before paying for a new generation.
+    Returns True when the held back submission should be generated anyway.
+    """
+    st.subheader("Similar existing backgrounds")
+    st.caption("These earlier backgrounds match your description. Use one of them, or generate a new one.")
+    columns = st.columns(4)
+    for n, entry in enumerate(st.session_state.similar_images):
+        with columns[n % len(columns)]:
+            thumbnail = image_source(entry['thumb_key'])
+            if thumbnail is None:
+                continue
+            st.image(thumbnail, caption=f"{entry['prompt'][:80]} ({entry['similarity']:.0%} similar)")
+            if st.button("Use this", key=f"similar_use_{entry['id']}", help=entry['model_path']):
+                # Also drop results of earlier submissions still pending, so they don't replace it
+                detach_jobs()
+                st.session_state.generated_images = [entry]
+                st.session_state.similar_images = []
+                st.session_state.pending_submission = None
+                st.rerun()
+    return st.button("Generate anyway", key="similar_generate", type="primary")
+
+def reset_history_page():
+    """Go back to the first history page when the search changes"""
+    st.session_state.history_page = 0
+
+@st.fragment
+def render_history():
+    """Searchable gallery of earlier generations, loading one page of thumbnails at a time"""
+    st.subheader("History")
+    query = st.text_input(
+        "Search prompts:",
+        key="history_query",
+        placeholder="office, beach, ...",
+        on_change=reset_history_page
     )
 
-    # Create a mapping for easy lookup
-    return {
-        f"{model['name']}": {
-            "service": model['service'],
-            "path": model['path'],
-            "description": model['description']
-        }
-        for model in all_models
-    }
+    page_size = Config.HISTORY_PAGE_SIZE
+    entries, total = history.search(query, st.session_state.history_page, page_size)
+    if not total:
+        st.caption("No matching images." if query else "Generated images will show up here.")
+        return
+
+    columns = st.columns(4)
+    for n, entry in enumerate(entries):
+        with columns[n % len(columns)]:
+            thumbnail = image_source(entry['thumb_key'])
+            if thumbnail is None:
+                st.caption("This image is no longer available.")
+                continue
+            st.image(thumbnail, caption=entry['prompt'][:80])
+            if st.button("Open", key=f"history_open_{entry['id']}", help=entry['model_path']):
+                # Show it with the download buttons above, instead of results still pending
+                detach_jobs()
+                st.session_state.generated_images = [entry]
+                st.rerun()
+
+    pages = math.ceil(total / page_size)
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        if st.button("Previous", key="history_prev", disabled=st.session_state.history_page == 0):
+            st.session_state.history_page -= 1
+            st.rerun(scope="fragment")
+    with col_page:
+        st.caption(f"Page {st.session_state.history_page + 1} of {pages} ({total} images)")
+    with col_next:
+        if st.button("Next", key="history_next", disabled=st.session_state.history_page >= pages - 1):
+            st.session_state.history_page += 1
+            st.rerun(scope="fragment")
+
+async def run_generation(clients, prompt: str, number_of_images: int, targets: list, tier=None, settings=None):
+    """Generate on the target models, or on the fastest models of tier, in the job queue or in this script run"""
+    # Routed requests pick their model while running, so they stay in this process
+    if Config.JOB_QUEUE_ENABLED and tier is None:
+        # Hand the calls to the worker processes and poll for results
+        st.session_state.job_ids = [
+            job_queue.submit(call_service, model_path, prompt, params, variant)
+            for call_service, model_path, params, variant in generation.expand_calls(targets, number_of_images)
+        ]
+        st.session_state.generated_images = []
+        st.session_state.job_errors = []
+        st.query_params['jobs'] = ','.join(st.session_state.job_ids)
+    else:
+        # Show images as soon as each call finishes
+        st.session_state.generated_images = []
+        queue_status = st.empty()
+        progress = st.empty()
+
+        def on_wait(position: int, estimated_wait: float):
+            queue_status.info(f"Waiting in queue: position {position}, about {estimated_wait:.0f}s")
+
+        def on_progress(model_path: str, message: str):
+            queue_status.caption(f"{model_path}: {message}")
+
+        if tier is not None:
+            results = router.fan_out(clients, tier, prompt, settings, number_of_images, on_wait, on_progress)
+        else:
+            results = generation.fan_out(clients, targets, prompt, number_of_images, on_wait, on_progress)
+
+        with st.spinner("Generating your Teams background..."):
+            async for _, model_path, entries, error in results:
+                queue_status.empty()
+                if isinstance(error, ProviderError) and error.retryable:
+                    st.error(f"{model_path} is busy right now, please try again in a moment.")
+                    continue
+                if error is not None:
+                    st.error(f"Error ({model_path}): {str(error)}")
+                    continue
+
+                # Keep only lightweight references to the stored images
+                st.session_state.generated_images.extend(entries)
+                with progress.container():
+                    for image_data in st.session_state.generated_images:
+                        st.image(image_source(image_data['thumb_key']))
+        progress.empty()
+
+async def submit_generation(clients, submission: dict):
+    """Start the generation of a submitted form"""
+    metrics.new_request_id()
+    st.session_state.draft = submission['draft']
+    await run_generation(
+        clients, submission['prompt'], submission['number_of_images'], submission['targets'],
+        submission['tier'], submission['settings']
+    )
 
-def download_image(url: str) -> bytes:
-    """Download image from URL"""
-    response = requests.get(url)
-    response.raise_for_status()
-    return response.content
+def request_refine():
+    """Ask the next script run to refine the current drafts"""
+    st.session_state.refine_requested = True
 
 def on_model_change():
     """Handle model selection change"""
@@ -100,24 +314,50 @@ async def main():
 
     # Initialize clients
     clients = initialize_clients()
-    if not clients:
+    if clients is None:
         return
 
     # Initialize models
-    st.session_state.model_info = initialize_models(clients)
-
-    # Model selection outside the form
-    selected_model_name = st.selectbox(
-        "Select model:",
-        options=list(st.session_state.model_info.keys()),
-        help="Choose between different AI models for image generation",
-        key="model_select",
-        on_change=on_model_change
+    st.session_state.model_info = initialize_models()
+
+    # Route to the fastest model of a tier instead of a fixed model
+    routing = st.toggle(
+        "Fastest available",
+        help="Send each request to the currently fastest model of a tier, "
+             "switching to another model when it fails or is unusually slow"
+    )
+
+    # Quick drafts on the fast models first, then refine one on a high quality model
+    drafting = not routing and st.toggle(
+        "Draft first",
+        help="Get quick drafts from the fast models, then refine the one you like with the selected model"
     )
 
-    # Get the selected model info
-    selected_model = st.session_state.model_info[selected_model_name]
-    service = selected_model["service"]
+    if routing:
+        tier = st.selectbox("Tier:", options=router.TIERS, format_func=str.title, key="tier_select")
+        ranked = router.candidates(tier)
+        if not ranked:
+            st.error(f"No {tier} models are configured.")
+            return
+        # Settings follow the model currently ranked first
+        selected_model_name = None
+        service = ranked[0][0]
+    else:
+        # Model selection outside the form; when drafting, the model to refine with
+        selected_model_name = st.selectbox(
+            "Refine with:" if drafting else "Select model:",
+            options=[
+                name for name, model in st.session_state.model_info.items()
+                if not drafting or model['tier'] != 'fast'
+            ],
+            help="Choose between different AI models for image generation",
+            key="model_select",
+            on_change=on_model_change
+        )
+
+        # Get the selected model info
+        selected_model = st.session_state.model_info[selected_model_name]
+        service = selected_model["service"]
     st.session_state.selected_service = service
 
     # UI Elements
@@ -137,22 +377,25 @@ async def main():
                 if service == "vertex":
                     aspect_ratio = st.selectbox(
                         "Aspect Ratio:",
-                        options=["16:9", "1:1", "9:16", "4:3", "3:4"],
+                        options=registry.client_class('vertex').SUPPORTED_ASPECT_RATIOS,
                         index=0,
-                        help="Supported aspect ratios for Imagen"
+                        help="16:9 is recommended for Teams backgrounds; other ratios are center-cropped "
+                             "to 16:9 for Teams and kept as generated in the original download"
                     )
                 else:
                     aspect_ratio = st.selectbox(
                         "Aspect Ratio:",
-                        options=["16:9", "3:2", "1:1", "2:3"],
+                        options=registry.client_class('replicate').SUPPORTED_ASPECT_RATIOS,
                         index=0,
-                        help="16:9 is recommended for Teams backgrounds"
+                        help="16:9 is recommended for Teams backgrounds; other ratios are center-cropped "
+                             "to 16:9 for Teams and kept as generated in the original download"
                     )
                     output_format = st.selectbox(
-                        "Output Format:",
+                        "Original Format:",
                         options=["png", "jpg"],
                         index=0,
-                        help="PNG recommended for better quality"
+                        help=f"Format of the original download; the Teams download is always "
+                             f"{Config.POSTPROCESS_FORMAT.upper()}"
                     )
 
             with col2:
@@ -174,54 +417,89 @@ async def main():
                     )
                     raw = st.checkbox("Raw Output", value=False, help="RAW Images are less processed and can produce more varied results")
 
+            number_of_images = st.slider(
+                "Drafts per fast model:" if drafting else "Variants per model:",
+                min_value=1, max_value=4, value=1,
+                help="Number of images to generate with each selected model"
+            )
+            extra_model_names = [] if routing or drafting else st.multiselect(
+                "Also generate with:",
+                options=[name for name in st.session_state.model_info if name != selected_model_name],
+                help="Run the same prompt on additional models at the same time"
+            )
+
         # Submit button
         submit = st.form_submit_button("Generate Background")
 
     # Handle form submission
     if submit and prompt:
-        try:
-            with st.spinner("Generating your Teams background..."):
-                # Get the model path from the selected model
-                model_path = selected_model["path"]
-
-                # Generate image using the appropriate service
-                if service == "replicate":
-                    result = await clients['replicate'].generate_image(
-                        prompt=prompt,
-                        model_path=model_path,
-                        raw=raw,
-                        aspect_ratio=aspect_ratio,
-                        output_format=output_format,
-                        safety_tolerance=safety_tolerance,
-                        image_prompt_strength=image_prompt_strength
-                    )
-                else:  # vertex
-                    result = await clients['vertex'].generate_image(
-                        prompt=prompt,
-                        model_path=model_path,
-                        raw=raw,
-                        aspect_ratio=aspect_ratio,
-                        safety_tolerance=safety_tolerance,
-                        image_prompt_strength=image_prompt_strength
-                    )
+        settings = {
+            'raw': raw,
+            'aspect_ratio': aspect_ratio,
+            'safety_tolerance': safety_tolerance,
+            'image_prompt_strength': image_prompt_strength
+        }
+        if service == "replicate":
+            settings['output_format'] = output_format
+
+        if drafting:
+            # Drafts come from every fast model; the settings are kept for the refine step
+            model_names = [name for name, model in st.session_state.model_info.items() if model['tier'] == 'fast']
+            draft = {'prompt': prompt, 'settings': settings}
+        else:
+            # Selected model first, then any additional models
+            model_names = [] if routing else [selected_model_name] + extra_model_names
+            draft = None
+
+        targets = []
+        for model_name in model_names:
+            model = st.session_state.model_info[model_name]
+            params = generation.build_params(model["service"], settings)
+            targets.append((model["service"], model["path"], params))
+
+        submission = {
+            'prompt': prompt,
+            'number_of_images': number_of_images,
+            'targets': targets,
+            'tier': tier if routing else None,
+            'settings': settings,
+            'draft': draft
+        }
 
-                if result.get('status') == 'success':
-                    # Store the result in session state with appropriate format
-                    if service == "vertex":
-                        format = "png"  # Vertex AI always returns PNG
-                    else:
-                        format = output_format
-
-                    st.session_state.generated_images = [{
-                        'url': url,
-                        'format': format,
-                        'metadata': result.get('metadata', {}),
-                        'service': service
-                    } for url in result.get('urls', [])]
-
-        except Exception as e:
-            st.error(f"Error: {str(e)}")
-            return
+        # Look up similar earlier prompts before paying for a new generation
+        st.session_state.similar_images = []
+        st.session_state.pending_submission = None
+        if Config.HISTORY_ENABLED and Config.SIMILARITY_ENABLED:
+            st.session_state.similar_images = find_similar(prompt)
+        if st.session_state.similar_images:
+            st.session_state.pending_submission = submission
+        else:
+            await submit_generation(clients, submission)
+
+    if st.session_state.similar_images and render_similar_images():
+        submission = st.session_state.pending_submission
+        st.session_state.similar_images = []
+        st.session_state.pending_submission = None
+        if submission is not None:
+            await submit_generation(clients, submission)
+
+    # Re-run the drafts' prompt and settings once on the model chosen to refine with
+    if st.session_state.refine_requested:
+        st.session_state.refine_requested = False
+        draft = st.session_state.draft
+        if drafting and draft is not None:
+            metrics.new_request_id()
+            model = st.session_state.model_info[selected_model_name]
+            params = generation.build_params(model["service"], draft['settings'])
+            st.session_state.draft = None
+            st.session_state.similar_images = []
+            st.session_state.pending_submission = None
+            await run_generation(clients, draft['prompt'], 1, [(model["service"], model["path"], params)])
+
+    if st.session_state.job_ids:
+        render_job_status()
+    for error in st.session_state.job_errors:
+        st.error(error)
 
     # Display generated images (outside the form)
     if st.session_state.generated_images:
@@ -231,37 +509,41 @@ async def main():
             # Create columns for image and buttons
             col1, col2 = st.columns([4, 1])
 
-            # Display image
+            # Images are served from the local image store
+            thumbnail = image_source(image_data['thumb_key'])
+            if thumbnail is None or not image_store.exists(image_data['teams_key']):
+                st.warning("This image is no longer available, please generate it again.")
+                continue
+
+            # Display the thumbnail rather than the full-resolution image
             with col1:
-                st.image(image_data['url'], use_container_width=True)
-                st.caption(f"Generated using {image_data['service'].title()} AI")
+                st.image(thumbnail)
+                st.caption(f"Generated using {image_data['service'].title()} AI ({image_data['model_path']})")
+                if drafting and st.session_state.draft is not None:
+                    st.button(
+                        f"Refine with {selected_model_name}",
+                        key=f"refine_{idx}",
+                        on_click=request_refine,
+                        help="Generate this prompt with the same settings on the high quality model"
+                    )
 
             # Display buttons
             with col2:
                 try:
-                    # Handle download differently based on service
-                    if image_data['service'] == 'vertex':
-                        # Extract base64 data from data URL
-                        base64_data = image_data['url'].split(',')[1]
-                        image_bytes = base64.b64decode(base64_data)
-                    else:
-                        # Regular URL download for Replicate
-                        image_bytes = download_image(image_data['url'])
-
-                    st.download_button(
-                        label="Download for Teams",
-                        data=image_bytes,
-                        file_name=f"teams_background_{idx+1}.{image_data['format']}",
-                        mime=f"image/{image_data['format']}",
-                        help="Click to download the image for use in Teams"
-                    )
+                    render_download_button(idx, image_data)
+                    render_download_button(idx, image_data, 'thumbnail')
+                    render_download_button(idx, image_data, 'original')
 
-                    # Only show direct link for non-data URLs (Replicate)
-                    if image_data['service'] != 'vertex':
+                    # Only show direct link for provider URLs (Replicate)
+                    if image_data.get('url'):
                         st.markdown(f"[Direct link]({image_data['url']})")
 
                 except Exception as e:
                     st.error(f"Error preparing download: {str(e)}")
 
+    if Config.HISTORY_ENABLED:
+        render_history()
+
 if __name__ == "__main__":
     asyncio.run(main())
+    metrics.observe_session_state(st.session_state)
@@ -0,0 +1,26 @@
+import os
+import sys
+
+from streamlit.web import cli as streamlit_cli
+
+from api.registry import registry
+from api import ops_server
+
+
+def main() -> int:
+    """
+    Start the health, readiness and metrics endpoints and the provider
+    warm-up, then run the Streamlit app in the same process.
+
+    Extra arguments are passed to "streamlit run".
+    """
+    ops_server.start()
+    registry.warm_up()
+
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    sys.argv = ['streamlit', 'run', app_path] + sys.argv[1:]
+    return streamlit_cli.main()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,308 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from typing import Dict, Optional, Tuple
+
+from utils.config import Config
+
+# Atomic token bucket for Redis: KEYS[1] bucket hash, ARGV rate per second,
+# capacity, now, take (1/0). Returns {acquired, seconds until available}.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local acquired = 0
+if tokens >= 1 and ARGV[4] == '1' then
+    tokens = tokens - 1
+    acquired = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], 3600)
+local wait = 0
+if tokens < 1 and rate > 0 then
+    wait = (1 - tokens) / rate
+end
+return {acquired, tostring(wait)}
+"""
+
+# Counting semaphore for Redis: KEYS[1] sorted set of slots scored by expiry,
+# ARGV now, limit, expiry of the new slot, slot id, key TTL. Returns 1 if taken.
+SLOT_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[4])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return 1
+"""
+
+
+def _refill(tokens: float, updated: float, now: float, rate: float, capacity: float) -> float:
+    return min(capacity, tokens + max(0.0, now - updated) * rate)
+
+
+class MemoryBackend:
+    """
+    In-process key-value store, token buckets and slots. The default without
+    the job queue; nothing is shared with other processes or replicas.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[str, Tuple[float, str]] = {}
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._slots: Dict[str, Dict[str, float]] = {}
+
+    def get(self, key: str) -> Optional[str]:
+        """Get a value, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._values[key]
+                return None
+            return entry[1]
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        """Store a value for ttl seconds."""
+        with self._lock:
+            self._values[key] = (time.monotonic() + ttl, value)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._values.pop(key, None)
+
+    def take_token(self, name: str, rate: float, capacity: float, take: bool = True) -> Tuple[bool, float]:
+        """
+        Take a token from a token bucket.
+
+        Args:
+            name: Bucket name
+            rate: Tokens added per second
+            capacity: Maximum number of tokens
+            take: False only checks the bucket
+
+        Returns:
+            (whether a token was taken, seconds until a token is available)
+        """
+        with self._lock:
+            now = time.monotonic()
+            tokens, updated = self._buckets.get(name, (capacity, now))
+            tokens = _refill(tokens, updated, now, rate, capacity)
+            acquired = take and tokens >= 1
+            if acquired:
+                tokens -= 1
+            self._buckets[name] = (tokens, now)
+        wait = (1 - tokens) / rate if tokens < 1 and rate > 0 else 0.0
+        return acquired, wait
+
+    def acquire_slot(self, name: str, limit: int, lease: float) -> Optional[str]:
+        """
+        Take one of a limited number of slots, e.g. for a running provider call.
+
+        Args:
+            name: Slot pool name
+            limit: Maximum number of slots held at once
+            lease: Seconds after which a slot that was never released expires,
+                so a crashed process does not hold it forever
+
+        Returns:
+            The slot id for release_slot, or None if all slots are taken
+        """
+        with self._lock:
+            now = time.monotonic()
+            slots = self._slots.setdefault(name, {})
+            for slot, expires_at in list(slots.items()):
+                if expires_at < now:
+                    del slots[slot]
+            if len(slots) >= limit:
+                return None
+            slot = uuid.uuid4().hex
+            slots[slot] = now + lease
+            return slot
+
+    def release_slot(self, name: str, slot: str) -> None:
+        """Give back a slot taken with acquire_slot."""
+        with self._lock:
+            self._slots.get(name, {}).pop(slot, None)
+
+
+class FileBackend:
+    """
+    Key-value store, token buckets and slots in a SQLite file. Replicas and
+    job workers that mount the same volume share cached results and limits.
+    """
+
+    shared = True
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL);
+    CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL);
+    CREATE TABLE IF NOT EXISTS slots (slot TEXT PRIMARY KEY, name TEXT NOT NULL, expires_at REAL NOT NULL);
+    CREATE INDEX IF NOT EXISTS slots_name ON slots (name, expires_at);
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLite database file
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def get(self, key: str) -> Optional[str]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT value FROM kv WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM kv WHERE expires_at < ?", (now,))
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)", (key, value, now + ttl)
+            )
+
+    def delete(self, key: str) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def take_token(self, name: str, rate: float, capacity: float, take: bool = True) -> Tuple[bool, float]:
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+                tokens, updated = row if row else (capacity, now)
+                tokens = _refill(tokens, updated, now, rate, capacity)
+                acquired = take and tokens >= 1
+                if acquired:
+                    tokens -= 1
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)", (name, tokens, now)
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        wait = (1 - tokens) / rate if tokens < 1 and rate > 0 else 0.0
+        return acquired, wait
+
+    def acquire_slot(self, name: str, limit: int, lease: float) -> Optional[str]:
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                conn.execute("DELETE FROM slots WHERE name = ? AND expires_at < ?", (name, now))
+                held = conn.execute("SELECT COUNT(*) FROM slots WHERE name = ?", (name,)).fetchone()[0]
+                slot = None
+                if held < limit:
+                    slot = uuid.uuid4().hex
+                    conn.execute(
+                        "INSERT INTO slots (slot, name, expires_at) VALUES (?, ?, ?)", (slot, name, now + lease)
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return slot
+
+    def release_slot(self, name: str, slot: str) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM slots WHERE slot = ?", (slot,))
+
+
+class RedisBackend:
+    """
+    Key-value store, token buckets and slots in Redis, or any server speaking
+    its protocol. Replicas share cached results and limits over the network.
+    """
+
+    shared = True
+
+    # Prefix of every key, so the server can be shared with other apps
+    PREFIX = 'tbg:'
+
+    @staticmethod
+    def load_sdk():
+        """Import the redis client, which is only needed for this backend."""
+        import redis
+        return redis
+
+    def __init__(self, url: str):
+        """
+        Args:
+            url: Server URL, e.g. redis://redis:6379/0
+        """
+        redis = self.load_sdk()
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self._take_token = self.client.register_script(TOKEN_BUCKET_SCRIPT)
+        self._acquire_slot = self.client.register_script(SLOT_SCRIPT)
+
+    def get(self, key: str) -> Optional[str]:
+        return self.client.get(self.PREFIX + key)
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        self.client.set(self.PREFIX + key, value, px=max(1, int(ttl * 1000)))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.PREFIX + key)
+
+    def take_token(self, name: str, rate: float, capacity: float, take: bool = True) -> Tuple[bool, float]:
+        acquired, wait = self._take_token(
+            keys=[f"{self.PREFIX}bucket:{name}"],
+            args=[rate, capacity, time.time(), '1' if take else '0']
+        )
+        return bool(int(acquired)), float(wait)
+
+    def acquire_slot(self, name: str, limit: int, lease: float) -> Optional[str]:
+        now = time.time()
+        slot = uuid.uuid4().hex
+        acquired = self._acquire_slot(
+            keys=[f"{self.PREFIX}slots:{name}"],
+            args=[now, limit, now + lease, slot, max(1, int(lease) + 1)]
+        )
+        return slot if int(acquired) else None
+
+    def release_slot(self, name: str, slot: str) -> None:
+        self.client.zrem(f"{self.PREFIX}slots:{name}", slot)
+
+
+def create_backend(kind: str, url: str):
+    """
+    Create the backend selected by Config.SHARED_BACKEND.
+
+    Args:
+        kind: "memory", "file" or "redis"
+        url: SQLite file for "file", server URL for "redis"
+    """
+    if kind == 'file':
+        return FileBackend(url or os.path.join(os.path.dirname(Config.JOB_DB_PATH), 'shared.sqlite3'))
+    if kind == 'redis':
+        return RedisBackend(url or 'redis://localhost:6379/0')
+    if kind != 'memory':
+        raise ValueError(f"Unknown SHARED_BACKEND: {kind}")
+    return MemoryBackend()
+
+
+# Shared backend for the whole process
+backend = create_backend(Config.SHARED_BACKEND, Config.SHARED_BACKEND_URL)
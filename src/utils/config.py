@@ -1,6 +1,8 @@
 import os
 import base64
-from dotenv import load_dotenv
+import hashlib
+import tempfile
+from dotenv import load_dotenv, find_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
@@ -16,6 +18,113 @@ class Config:
 
     # App password protection
     APP_PASSWORD = os.getenv('APP_PASSWORD')
+
+    # Load provider SDKs in the background at startup instead of on first use
+    WARM_UP_PROVIDERS = os.getenv('WARM_UP_PROVIDERS', 'true').lower() in ('1', 'true', 'yes')
+
+    # Maximum number of concurrent blocking provider calls per worker process
+    GENERATION_WORKERS = int(os.getenv('GENERATION_WORKERS', '8'))
+
+    # Maximum number of concurrent calls per provider within one submission
+    PROVIDER_CONCURRENCY = {
+        'replicate': int(os.getenv('REPLICATE_CONCURRENCY', '4')),
+        'vertex': int(os.getenv('VERTEX_CONCURRENCY', '2'))
+    }
+
+    # Process-wide admission control shared by all sessions
+    PROVIDER_RATE_PER_MINUTE = {
+        'replicate': float(os.getenv('REPLICATE_RATE_PER_MINUTE', '60')),
+        'vertex': float(os.getenv('VERTEX_RATE_PER_MINUTE', '20'))
+    }
+    PROVIDER_BURST = {
+        'replicate': int(os.getenv('REPLICATE_BURST', '5')),
+        'vertex': int(os.getenv('VERTEX_BURST', '2'))
+    }
+    PROVIDER_MAX_IN_FLIGHT = {
+        'replicate': int(os.getenv('REPLICATE_MAX_IN_FLIGHT', '8')),
+        'vertex': int(os.getenv('VERTEX_MAX_IN_FLIGHT', '4'))
+    }
+    PROVIDER_MAX_RETRIES = int(os.getenv('PROVIDER_MAX_RETRIES', '3'))
+
+    # Replicate calls: "predictions" (polled, cancelable, with deadline) or "run" (blocking)
+    REPLICATE_MODE = os.getenv('REPLICATE_MODE', 'predictions')
+    REPLICATE_PREDICTION_TIMEOUT = float(os.getenv('REPLICATE_PREDICTION_TIMEOUT', '300'))
+    REPLICATE_POLL_MIN_SECONDS = float(os.getenv('REPLICATE_POLL_MIN_SECONDS', '0.5'))
+    REPLICATE_POLL_MAX_SECONDS = float(os.getenv('REPLICATE_POLL_MAX_SECONDS', '5'))
+
+    # Downloads of provider outputs
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+    HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '60'))
+    HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '3'))
+
+    # Local store for generated images
+    IMAGE_STORE_DIR = os.getenv(
+        'IMAGE_STORE_DIR',
+        os.path.join(tempfile.gettempdir(), 'teams-background-generator', 'images')
+    )
+    IMAGE_STORE_MAX_BYTES = int(os.getenv('IMAGE_STORE_MAX_MB', '1024')) * 1024 * 1024
+
+    # Teams-ready assets created from every generated image
+    POSTPROCESS_FORMAT = os.getenv('POSTPROCESS_FORMAT', 'jpg').lower()  # jpg or webp
+    POSTPROCESS_QUALITY = int(os.getenv('POSTPROCESS_QUALITY', '85'))
+    POSTPROCESS_WORKERS = int(os.getenv('POSTPROCESS_WORKERS', '2'))
+
+    # Durable job queue served by separate worker processes
+    JOB_QUEUE_ENABLED = os.getenv('JOB_QUEUE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    JOB_DB_PATH = os.getenv(
+        'JOB_DB_PATH',
+        os.path.join(tempfile.gettempdir(), 'teams-background-generator', 'jobs.sqlite3')
+    )
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))  # 0 when workers run in their own container
+    JOB_WORKER_CONCURRENCY = int(os.getenv('JOB_WORKER_CONCURRENCY', '4'))
+    JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', '1'))
+    JOB_HEARTBEAT_SECONDS = float(os.getenv('JOB_HEARTBEAT_SECONDS', '10'))
+    JOB_QUEUE_MAX_PENDING = int(os.getenv('JOB_QUEUE_MAX_PENDING', '100'))  # Not ready above this
+
+    # Backend shared by replicas for cached results, rate limits and job state:
+    # "memory" (this process only), "file" (SQLite file on a shared volume) or "redis".
+    # Job workers are separate processes, so the job queue needs a shared one.
+    SHARED_BACKEND = os.getenv('SHARED_BACKEND', 'file' if JOB_QUEUE_ENABLED else 'memory').lower()
+    SHARED_BACKEND_URL = os.getenv('SHARED_BACKEND_URL', '')  # File path or redis:// URL
+
+    # Readiness checks
+    HEALTH_CHECK_TTL = float(os.getenv('HEALTH_CHECK_TTL', '60'))
+
+    # Port of the /healthz, /readyz and /metrics endpoints (0 disables them) and span-style timing logs
+    OPS_PORT = int(os.getenv('OPS_PORT', '9100'))
+    # Address under which browsers reach the ops server, for image links; unset embeds the images
+    IMAGE_BASE_URL = os.getenv('IMAGE_BASE_URL', '')
+    TRACE_SPANS = os.getenv('TRACE_SPANS', 'false').lower() in ('1', 'true', 'yes')
+
+    # Persistent, searchable history of generated images
+    HISTORY_ENABLED = os.getenv('HISTORY_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    HISTORY_DB_PATH = os.getenv(
+        'HISTORY_DB_PATH',
+        os.path.join(tempfile.gettempdir(), 'teams-background-generator', 'history.sqlite3')
+    )
+    HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '12'))
+
+    # Suggest stored images with similar prompts on submit (needs the history)
+    SIMILARITY_ENABLED = os.getenv('SIMILARITY_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    SIMILARITY_DIMENSIONS = int(os.getenv('SIMILARITY_DIMENSIONS', '256'))
+    SIMILARITY_RESULTS = int(os.getenv('SIMILARITY_RESULTS', '4'))
+    SIMILARITY_MIN_SCORE = float(os.getenv('SIMILARITY_MIN_SCORE', '0.35'))
+
+    # Opt-in cache of identical generation requests
+    RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', '3600'))
+    RESULT_CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '1000'))
+
+    # "Fastest available" routing across the models of a tier
+    ROUTING_WINDOW = int(os.getenv('ROUTING_WINDOW', '50'))  # Recent calls kept per model
+    ROUTING_MIN_SAMPLES = int(os.getenv('ROUTING_MIN_SAMPLES', '5'))
+    ROUTING_DEFAULT_SECONDS = float(os.getenv('ROUTING_DEFAULT_SECONDS', '20'))  # Assumed latency before that
+    HEDGE_ENABLED = os.getenv('HEDGE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    HEDGE_DEFAULT_SECONDS = float(os.getenv('HEDGE_DEFAULT_SECONDS', '30'))  # Hedge delay before p95 is known
+
+    # Path and modification time of the .env file last loaded
+    _dotenv_path = find_dotenv(usecwd=True)
+    _dotenv_mtime = None
     
     @classmethod
     def is_password_protected(cls):
@@ -30,17 +139,71 @@ class Config:
         return None
 
     @classmethod
-    def validate(cls):
-        """Validate that all required environment variables are set"""
-        required_vars = [
-            'REPLICATE_API_TOKEN',
-            'GOOGLE_PROJECT_ID',
-            'GOOGLE_CREDENTIALS_BASE64'  # Changed from GOOGLE_APPLICATION_CREDENTIALS
+    def fingerprint(cls):
+        """Hash of all provider settings, used to detect credential or config changes"""
+        values = [
+            cls.REPLICATE_API_TOKEN,
+            cls.GOOGLE_PROJECT_ID,
+            cls.GOOGLE_LOCATION,
+            cls.GOOGLE_CREDENTIALS_BASE64
         ]
-        
-        missing_vars = [var for var in required_vars if not getattr(cls, var)]
-        
-        if missing_vars:
+        return hashlib.sha256("\0".join(v or "" for v in values).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def reload(cls):
+        """Re-read settings from the environment and the .env file"""
+        if cls._dotenv_path:
+            load_dotenv(cls._dotenv_path, override=True)
+        cls.REPLICATE_API_TOKEN = os.getenv('REPLICATE_API_TOKEN')
+        cls.GOOGLE_PROJECT_ID = os.getenv('GOOGLE_PROJECT_ID')
+        cls.GOOGLE_LOCATION = os.getenv('GOOGLE_LOCATION', 'us-central1')
+        cls.GOOGLE_CREDENTIALS_BASE64 = os.getenv('GOOGLE_CREDENTIALS_BASE64')
+        cls.APP_PASSWORD = os.getenv('APP_PASSWORD')
+
+    @classmethod
+    def reload_if_changed(cls):
+        """Reload settings when the .env file has been modified since the last check"""
+        if not cls._dotenv_path:
+            return False
+        try:
+            mtime = os.stat(cls._dotenv_path).st_mtime
+        except OSError:
+            return False
+        if cls._dotenv_mtime is None:
+            cls._dotenv_mtime = mtime
+            return False
+        if mtime == cls._dotenv_mtime:
+            return False
+        cls._dotenv_mtime = mtime
+        cls.reload()
+        return True
+
+    # Environment variables each provider needs to be enabled
+    PROVIDER_REQUIREMENTS = {
+        'replicate': ['REPLICATE_API_TOKEN'],
+        'vertex': ['GOOGLE_PROJECT_ID', 'GOOGLE_CREDENTIALS_BASE64']
+    }
+
+    @classmethod
+    def available_providers(cls):
+        """Get the providers whose credentials are configured"""
+        return [
+            provider for provider, required_vars in cls.PROVIDER_REQUIREMENTS.items()
+            if all(getattr(cls, var) for var in required_vars)
+        ]
+
+    @classmethod
+    def validate(cls):
+        """Validate that at least one provider is fully configured and the other settings are usable"""
+        if cls.POSTPROCESS_FORMAT not in ('jpg', 'webp'):
+            raise EnvironmentError(f"POSTPROCESS_FORMAT must be jpg or webp, not {cls.POSTPROCESS_FORMAT}")
+        if cls.JOB_QUEUE_ENABLED and cls.SHARED_BACKEND == 'memory':
+            raise EnvironmentError(
+                "SHARED_BACKEND=memory keeps rate limits per process, so every job worker would get its own; "
+                "use file or redis with JOB_QUEUE_ENABLED"
+            )
+        if not cls.available_providers():
+            required_vars = [var for required in cls.PROVIDER_REQUIREMENTS.values() for var in required]
             raise EnvironmentError(
-                f"Missing required environment variables: {', '.join(missing_vars)}"
+                f"No image provider configured, set the variables for at least one of them: {', '.join(required_vars)}"
             )
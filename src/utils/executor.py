@@ -0,0 +1,40 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from utils.config import Config
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Get the process-wide bounded thread pool used for blocking provider calls.
+
+    The pool size is taken from Config.GENERATION_WORKERS.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=Config.GENERATION_WORKERS,
+                    thread_name_prefix="generation"
+                )
+    return _executor
+
+
+async def run_blocking(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Run a blocking function in the shared executor without stalling the event loop.
+
+    Args:
+        func: The blocking callable
+        *args: Positional arguments for func
+        **kwargs: Keyword arguments for func
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
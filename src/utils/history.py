@@ -0,0 +1,156 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+from typing import Any, Dict, List, Tuple
+
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    prompt TEXT NOT NULL,
+    service TEXT NOT NULL,
+    model_path TEXT NOT NULL,
+    params TEXT NOT NULL,
+    key TEXT NOT NULL,
+    teams_key TEXT NOT NULL,
+    thumb_key TEXT NOT NULL,
+    url TEXT,
+    format TEXT NOT NULL,
+    teams_format TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+"""
+
+# Full-text index over the prompts, kept in sync by triggers
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(prompt, content='history', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history BEGIN
+    INSERT INTO history_fts (rowid, prompt) VALUES (new.id, new.prompt);
+END;
+CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history BEGIN
+    INSERT INTO history_fts (history_fts, rowid, prompt) VALUES ('delete', old.id, old.prompt);
+END;
+"""
+
+
+class History:
+    """
+    Persistent index of generated images backed by SQLite.
+
+    Every stored image is recorded with its prompt, model, parameters and
+    image store keys, so it can be found and downloaded again later
+    instead of being generated (and paid for) a second time. Prompts are
+    searched with an FTS5 index when SQLite provides it.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize the history and create its schema.
+
+        Args:
+            path: SQLite database file
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            try:
+                conn.executescript(FTS_SCHEMA)
+                self.full_text = True
+            except sqlite3.OperationalError as e:
+                logger.warning("Full-text search not available, falling back to LIKE: %s", e)
+                self.full_text = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _to_entry(row: sqlite3.Row) -> Dict[str, Any]:
+        """Turn a row into an image entry as returned by generation.generate."""
+        entry = dict(row)
+        entry['params'] = json.loads(entry['params'])
+        entry['metadata'] = json.loads(entry['metadata'])
+        return entry
+
+    def add(self, prompt: str, params: Dict[str, Any], entries: List[Dict[str, Any]]) -> None:
+        """Record the images of one generation."""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.executemany(
+                "INSERT INTO history (created_at, prompt, service, model_path, params, key, teams_key, "
+                "thumb_key, url, format, teams_format, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(
+                    now, prompt, entry['service'], entry['model_path'], json.dumps(params, default=str),
+                    entry['key'], entry['teams_key'], entry['thumb_key'], entry.get('url'),
+                    entry['format'], entry['teams_format'], json.dumps(entry.get('metadata', {}), default=str)
+                ) for entry in entries]
+            )
+
+    def _where(self, query: str) -> Tuple[str, List[Any]]:
+        """WHERE clause matching query against the prompts."""
+        words = query.split()
+        if not words:
+            return "", []
+        if self.full_text:
+            # Every word must match as a prefix; quoting keeps FTS syntax out of user input
+            match = ' '.join('"{}"*'.format(word.replace('"', '""')) for word in words)
+            return "WHERE id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)", [match]
+        escaped = [word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') for word in words]
+        return (
+            "WHERE " + " AND ".join("prompt LIKE ? ESCAPE '\\'" for _ in words),
+            [f"%{word}%" for word in escaped]
+        )
+
+    def search(self, query: str = "", page: int = 0, page_size: int = 12) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Find images whose prompt matches query, newest first.
+
+        Args:
+            query: Words the prompt must contain; empty lists everything
+            page: 0-based page number
+            page_size: Entries per page
+
+        Returns:
+            (entries of the page, total number of matches)
+        """
+        where, args = self._where(query)
+        with closing(self._connect()) as conn:
+            (total,) = conn.execute(f"SELECT COUNT(*) FROM history {where}", args).fetchone()
+            rows = conn.execute(
+                f"SELECT * FROM history {where} ORDER BY id DESC LIMIT ? OFFSET ?",
+                args + [page_size, page * page_size]
+            ).fetchall()
+        return [self._to_entry(row) for row in rows], total
+
+    def get(self, entry_ids: List[int]) -> List[Dict[str, Any]]:
+        """Get entries by id, in the given order. Unknown ids are skipped."""
+        if not entry_ids:
+            return []
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT * FROM history WHERE id IN ({','.join('?' * len(entry_ids))})", entry_ids
+            ).fetchall()
+        entries = {row['id']: self._to_entry(row) for row in rows}
+        return [entries[entry_id] for entry_id in entry_ids if entry_id in entries]
+
+    def since(self, last_id: int) -> List[Tuple[int, str]]:
+        """(id, prompt) of the entries added after last_id, oldest first."""
+        with closing(self._connect()) as conn:
+            return [
+                tuple(row) for row in
+                conn.execute("SELECT id, prompt FROM history WHERE id > ? ORDER BY id", (last_id,)).fetchall()
+            ]
+
+
+# Shared history for the whole process
+history = History(Config.HISTORY_DB_PATH)
@@ -0,0 +1,79 @@
+import threading
+import time
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.config import Config
+from utils.metrics import BYTES_TRANSFERRED, span
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Get the process-wide HTTP session.
+
+    The session keeps connections alive across requests and retries 429
+    and 5xx responses with backoff. Connection errors and timeouts are
+    retried by download_image, which also covers reading the body.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=Config.HTTP_RETRIES,
+                    connect=0,
+                    read=0,
+                    backoff_factor=0.5,
+                    status_forcelist=[429, 500, 502, 503, 504],
+                    allowed_methods=["GET", "HEAD"]
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=Config.GENERATION_WORKERS,
+                    pool_maxsize=Config.GENERATION_WORKERS,
+                    max_retries=retry
+                )
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+# Network failures download_image retries: connection errors, timeouts and bodies cut off
+DOWNLOAD_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError
+)
+
+
+def download_image(url: str) -> bytes:
+    """
+    Download image from URL.
+
+    Network failures are retried here, up to Config.HTTP_RETRIES times with
+    backoff, so a slow download never makes a caller repeat the (paid)
+    request that produced the URL.
+    """
+    for attempt in range(Config.HTTP_RETRIES + 1):
+        try:
+            with span('download'):
+                response = get_session().get(
+                    url,
+                    timeout=(Config.HTTP_CONNECT_TIMEOUT, Config.HTTP_READ_TIMEOUT)
+                )
+                response.raise_for_status()
+                content = response.content
+            break
+        except DOWNLOAD_ERRORS:
+            if attempt == Config.HTTP_RETRIES:
+                raise
+            time.sleep(0.5 * 2 ** attempt)
+    BYTES_TRANSFERRED.labels('download').inc(len(content))
+    return content
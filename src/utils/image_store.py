@@ -0,0 +1,174 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import BinaryIO, Optional
+
+from utils.config import Config
+
+# Share of the size limit a process writes before it rescans the directory
+# for images stored and evicted by other processes
+RESCAN_FRACTION = 0.1
+
+
+class ImageStore:
+    """
+    Content-addressed on-disk store for generated images.
+
+    Images are written once under the SHA-256 of their bytes and referenced
+    by a short key ("<sha256>.<ext>"). The total size is bounded; the least
+    recently used images are evicted first.
+
+    Several processes (job workers, replicas on a shared volume) may use the
+    same directory. File modification times record when an image was last
+    used, and each process rescans the directory after writing
+    RESCAN_FRACTION of the limit, so images of all processes count towards
+    it. Between rescans the directory can exceed the limit by up to that
+    share per writing process.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        """
+        Initialize the image store.
+
+        Args:
+            root: Directory holding the image files
+            max_bytes: Maximum total size of stored images
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._unscanned_bytes = 0
+        os.makedirs(root, exist_ok=True)
+        self._load_index()
+
+    def _scan(self) -> "OrderedDict[str, int]":
+        """Sizes of the image files on disk, least recently used first."""
+        files = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.startswith('.'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(dirpath, filename))
+                except FileNotFoundError:
+                    # Evicted by another process meanwhile
+                    continue
+                files.append((stat.st_mtime, filename, stat.st_size))
+        return OrderedDict((key, size) for _, key, size in sorted(files))
+
+    def _load_index(self) -> None:
+        """Rebuild the LRU index from the files on disk, including those of other processes."""
+        entries = self._scan()
+        with self._lock:
+            self._entries = entries
+            self._total_bytes = sum(entries.values())
+            self._unscanned_bytes = 0
+
+    def _path(self, key: str) -> str:
+        if os.sep in key or '/' in key or key.startswith('.'):
+            raise ValueError(f"Invalid image key: {key}")
+        return os.path.join(self.root, key[:2], key)
+
+    def put(self, data: bytes, ext: str) -> str:
+        """
+        Store image bytes and return their key. Storing the same bytes twice is a no-op.
+
+        Args:
+            data: Encoded image bytes
+            ext: File extension without dot (e.g. "png")
+        """
+        key = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+        path = self._path(key)
+
+        with self._lock:
+            if key in self._entries:
+                try:
+                    os.utime(path)
+                except FileNotFoundError:
+                    pass  # Evicted by another process; store it again
+                else:
+                    self._entries.move_to_end(key)
+                    return key
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if key not in self._entries:
+                self._total_bytes += len(data)
+                self._unscanned_bytes += len(data)
+            self._entries[key] = len(data)
+            self._entries.move_to_end(key)
+            rescan = self._unscanned_bytes >= self.max_bytes * RESCAN_FRACTION
+
+        if rescan:
+            self._load_index()
+        with self._lock:
+            self._evict()
+        return key
+
+    def _evict(self) -> None:
+        """Remove least recently used images until the store fits. Must hold the lock."""
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def _touch(self, key: str) -> Optional[str]:
+        """Mark key as recently used and return its path, or None if missing."""
+        path = self._path(key)
+        if not os.path.exists(path):
+            with self._lock:
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self._total_bytes -= size
+            return None
+        with self._lock:
+            if key not in self._entries:
+                size = os.path.getsize(path)
+                self._entries[key] = size
+                self._total_bytes += size
+            self._entries.move_to_end(key)
+        try:
+            # Recency shared with the other processes using the directory
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def exists(self, key: str) -> bool:
+        """Check whether an image is still in the store."""
+        return os.path.exists(self._path(key))
+
+    def path(self, key: str) -> Optional[str]:
+        """Get the file path for key, or None if it has been evicted."""
+        return self._touch(key)
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        """Open the image for streaming reads, or return None if it has been evicted."""
+        path = self._touch(key)
+        if path is None:
+            return None
+        return open(path, 'rb')
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Read the image bytes, or return None if it has been evicted."""
+        f = self.open(key)
+        if f is None:
+            return None
+        with f:
+            return f.read()
+
+
+# Shared store for the whole process
+image_store = ImageStore(Config.IMAGE_STORE_DIR, Config.IMAGE_STORE_MAX_BYTES)
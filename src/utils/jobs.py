@@ -0,0 +1,343 @@
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+from typing import Any, Dict, List, Optional
+
+from utils.backend import RedisBackend, backend as shared_backend
+from utils.config import Config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    service TEXT NOT NULL,
+    model_path TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    params TEXT NOT NULL,
+    variant INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    retryable INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at) WHERE finished_at IS NOT NULL;
+"""
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Error of jobs cancelled before a worker claimed them
+CANCELLED_ERROR = 'Cancelled'
+
+# Finished jobs are dropped after a day; sessions collect results long before
+FINISHED_TTL = 24 * 3600
+
+
+class JobQueue:
+    """
+    Durable generation job queue backed by SQLite.
+
+    The app submits jobs and polls their status; worker processes claim
+    queued jobs, run them and store the result. Because the queue lives on
+    disk, a generation survives reruns, reloads and dropped websockets.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize the job queue and create its schema.
+
+        Args:
+            path: SQLite database file
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        job['retryable'] = bool(job['retryable'])
+        return job
+
+    def submit(self, service: str, model_path: str, prompt: str, params: Dict[str, Any], variant: int = 0) -> str:
+        """Add a job to the queue and return its id."""
+        job_id = uuid.uuid4().hex
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, service, model_path, prompt, params, variant, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, service, model_path, prompt, json.dumps(params), variant, time.time())
+            )
+        return job_id
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """Atomically take the oldest queued job, or return None if there is none."""
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                now = time.time()
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, started_at = ?, heartbeat_at = ? WHERE id = ?",
+                    (RUNNING, worker, now, now, row['id'])
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        job = self._to_dict(row)
+        job['status'] = RUNNING
+        return job
+
+    def heartbeat(self, job_id: str) -> None:
+        """Record that the worker running a job is still alive."""
+        with closing(self._connect()) as conn:
+            conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def complete(self, job_id: str, result: Any) -> None:
+        """Store the result of a finished job."""
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, finished_at = ? WHERE id = ?",
+                (DONE, json.dumps(result), time.time(), job_id)
+            )
+
+    def fail(self, job_id: str, error: str, retryable: bool = False) -> None:
+        """Mark a job as failed."""
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, retryable = ?, finished_at = ? WHERE id = ?",
+                (FAILED, error, int(retryable), time.time(), job_id)
+            )
+
+    def cancel(self, job_ids: List[str]) -> None:
+        """Fail the given jobs that no worker has claimed yet. Running jobs finish normally."""
+        if not job_ids:
+            return
+        with closing(self._connect()) as conn:
+            conn.execute(
+                f"UPDATE jobs SET status = ?, error = ?, finished_at = ? "
+                f"WHERE status = ? AND id IN ({','.join('?' * len(job_ids))})",
+                [FAILED, CANCELLED_ERROR, time.time(), QUEUED, *job_ids]
+            )
+
+    def requeue_stale(self, timeout: float) -> int:
+        """Put running jobs whose worker stopped sending heartbeats back in the queue."""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL WHERE status = ? AND heartbeat_at < ?",
+                (QUEUED, RUNNING, time.time() - timeout)
+            )
+            return cursor.rowcount
+
+    def purge(self, older_than: float = FINISHED_TTL) -> int:
+        """Delete done and failed jobs that finished more than older_than seconds ago."""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "DELETE FROM jobs WHERE finished_at < ? AND status IN (?, ?)",
+                (time.time() - older_than, DONE, FAILED)
+            )
+            return cursor.rowcount
+
+    def get(self, job_ids: List[str]) -> List[Dict[str, Any]]:
+        """Get jobs by id, in the given order. Unknown ids are skipped."""
+        if not job_ids:
+            return []
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT * FROM jobs WHERE id IN ({','.join('?' * len(job_ids))})", job_ids
+            ).fetchall()
+        jobs = {row['id']: self._to_dict(row) for row in rows}
+        return [jobs[job_id] for job_id in job_ids if job_id in jobs]
+
+    def position(self, job: Dict[str, Any]) -> int:
+        """1-based position of a queued job, 0 if it is not queued."""
+        if job['status'] != QUEUED:
+            return 0
+        with closing(self._connect()) as conn:
+            (ahead,) = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?", (QUEUED, job['created_at'])
+            ).fetchone()
+        return ahead + 1
+
+    def counts(self) -> Dict[str, int]:
+        """Number of queued and running jobs, read from the status index."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE status IN (?, ?) GROUP BY status", (QUEUED, RUNNING)
+            ).fetchall()
+        return {status: count for status, count in rows}
+
+
+# Atomically move the oldest queued job to running: KEYS[1] queued set,
+# KEYS[2] running set, ARGV now, worker, job key prefix. Returns the job id.
+CLAIM_SCRIPT = """
+local ids = redis.call('ZRANGE', KEYS[1], 0, 0)
+if #ids == 0 then
+    return false
+end
+local id = ids[1]
+redis.call('ZREM', KEYS[1], id)
+redis.call('ZADD', KEYS[2], ARGV[1], id)
+redis.call('HSET', ARGV[3] .. id, 'status', 'running', 'worker', ARGV[2], 'started_at', ARGV[1], 'heartbeat_at', ARGV[1])
+return id
+"""
+
+
+class RedisJobQueue:
+    """
+    Generation job queue in Redis, with the same interface as JobQueue.
+
+    Used with the "redis" shared backend, so app replicas and workers on
+    different hosts share one queue. Each job is a hash; queued and running
+    jobs are kept in sorted sets by creation and heartbeat time.
+    """
+
+    PREFIX = RedisBackend.PREFIX + 'jobs:'
+
+    def __init__(self, client):
+        """
+        Args:
+            client: redis.Redis client with decode_responses=True
+        """
+        self.client = client
+        self._queued = self.PREFIX + 'queued'
+        self._running = self.PREFIX + 'running'
+        self._claim = client.register_script(CLAIM_SCRIPT)
+
+    def _key(self, job_id: str) -> str:
+        return f"{self.PREFIX}job:{job_id}"
+
+    @staticmethod
+    def _to_dict(fields: Dict[str, str]) -> Dict[str, Any]:
+        job: Dict[str, Any] = {
+            key: fields.get(key) or None
+            for key in ('id', 'status', 'service', 'model_path', 'prompt', 'error', 'worker')
+        }
+        job['params'] = json.loads(fields['params'])
+        job['result'] = json.loads(fields['result']) if fields.get('result') else None
+        job['variant'] = int(fields.get('variant', 0))
+        job['retryable'] = fields.get('retryable') == '1'
+        for key in ('created_at', 'started_at', 'heartbeat_at', 'finished_at'):
+            job[key] = float(fields[key]) if fields.get(key) else None
+        return job
+
+    def submit(self, service: str, model_path: str, prompt: str, params: Dict[str, Any], variant: int = 0) -> str:
+        """Add a job to the queue and return its id."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        pipe = self.client.pipeline()
+        pipe.hset(self._key(job_id), mapping={
+            'id': job_id, 'status': QUEUED, 'service': service, 'model_path': model_path,
+            'prompt': prompt, 'params': json.dumps(params), 'variant': variant, 'created_at': now
+        })
+        pipe.zadd(self._queued, {job_id: now})
+        pipe.execute()
+        return job_id
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """Atomically take the oldest queued job, or return None if there is none."""
+        job_id = self._claim(keys=[self._queued, self._running], args=[time.time(), worker, self.PREFIX + 'job:'])
+        if not job_id:
+            return None
+        return self._to_dict(self.client.hgetall(self._key(job_id)))
+
+    def heartbeat(self, job_id: str) -> None:
+        """Record that the worker running a job is still alive."""
+        now = time.time()
+        pipe = self.client.pipeline()
+        pipe.hset(self._key(job_id), 'heartbeat_at', now)
+        pipe.zadd(self._running, {job_id: now}, xx=True)
+        pipe.execute()
+
+    def _finish(self, job_id: str, status: str, fields: Dict[str, Any]) -> None:
+        pipe = self.client.pipeline()
+        pipe.hset(self._key(job_id), mapping={'status': status, 'finished_at': time.time(), **fields})
+        pipe.expire(self._key(job_id), FINISHED_TTL)
+        pipe.zrem(self._running, job_id)
+        pipe.execute()
+
+    def complete(self, job_id: str, result: Any) -> None:
+        """Store the result of a finished job."""
+        self._finish(job_id, DONE, {'result': json.dumps(result)})
+
+    def fail(self, job_id: str, error: str, retryable: bool = False) -> None:
+        """Mark a job as failed."""
+        self._finish(job_id, FAILED, {'error': error, 'retryable': int(retryable)})
+
+    def cancel(self, job_ids: List[str]) -> None:
+        """Fail the given jobs that no worker has claimed yet. Running jobs finish normally."""
+        for job_id in job_ids:
+            # Removing the job from the queued set wins or loses against claim atomically
+            if self.client.zrem(self._queued, job_id):
+                self._finish(job_id, FAILED, {'error': CANCELLED_ERROR})
+
+    def requeue_stale(self, timeout: float) -> int:
+        """Put running jobs whose worker stopped sending heartbeats back in the queue."""
+        requeued = 0
+        for job_id in self.client.zrangebyscore(self._running, '-inf', time.time() - timeout):
+            # Only the worker that removes the job from the running set requeues it
+            if not self.client.zrem(self._running, job_id):
+                continue
+            created_at = self.client.hget(self._key(job_id), 'created_at')
+            pipe = self.client.pipeline()
+            pipe.hset(self._key(job_id), mapping={'status': QUEUED, 'worker': ''})
+            pipe.zadd(self._queued, {job_id: float(created_at or time.time())})
+            pipe.execute()
+            requeued += 1
+        return requeued
+
+    def purge(self, older_than: float = FINISHED_TTL) -> int:
+        """Finished jobs expire on their own after FINISHED_TTL, so there is nothing to delete."""
+        return 0
+
+    def get(self, job_ids: List[str]) -> List[Dict[str, Any]]:
+        """Get jobs by id, in the given order. Unknown ids are skipped."""
+        if not job_ids:
+            return []
+        pipe = self.client.pipeline()
+        for job_id in job_ids:
+            pipe.hgetall(self._key(job_id))
+        return [self._to_dict(fields) for fields in pipe.execute() if fields]
+
+    def position(self, job: Dict[str, Any]) -> int:
+        """1-based position of a queued job, 0 if it is not queued."""
+        rank = self.client.zrank(self._queued, job['id'])
+        return 0 if rank is None else rank + 1
+
+    def counts(self) -> Dict[str, int]:
+        """Number of queued and running jobs."""
+        return {QUEUED: self.client.zcard(self._queued), RUNNING: self.client.zcard(self._running)}
+
+
+# Shared queue for the whole process; in Redis with the "redis" shared backend.
+# The SQLite queue is shared by replicas that mount JOB_DB_PATH on the same volume.
+if isinstance(shared_backend, RedisBackend):
+    job_queue = RedisJobQueue(shared_backend.client)
+else:
+    job_queue = JobQueue(Config.JOB_DB_PATH)
@@ -0,0 +1,195 @@
+import atexit
+import contextvars
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Iterator, Mapping, Optional, Tuple
+
+from utils.config import Config
+
+# Worker processes record their metrics in files under this directory, which
+# /metrics merges. It must be set before prometheus_client is imported, and
+# spawned workers inherit it from the app process.
+if Config.JOB_QUEUE_ENABLED and 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='tbg-metrics-')
+    atexit.register(shutil.rmtree, os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+MULTIPROCESS = 'PROMETHEUS_MULTIPROC_DIR' in os.environ
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# Buckets sized for multi-second image generation
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 1e6, 5e6, 1e7, 5e7)
+
+PROVIDER_LATENCY = Histogram(
+    'tbg_provider_request_seconds', 'Latency of provider generate_image calls',
+    ['service', 'model'], buckets=LATENCY_BUCKETS
+)
+PROVIDER_ERRORS = Counter(
+    'tbg_provider_errors_total', 'Failed provider calls by error class',
+    ['service', 'model', 'error']
+)
+PROVIDER_IN_FLIGHT = Gauge(
+    'tbg_provider_in_flight', 'Provider calls currently running',
+    ['service'], multiprocess_mode='livesum'
+)
+STAGE_LATENCY = Histogram(
+    'tbg_stage_seconds', 'Latency of each stage of a generation request',
+    ['stage'], buckets=LATENCY_BUCKETS
+)
+BYTES_TRANSFERRED = Counter(
+    'tbg_bytes_total', 'Image bytes moved by the app',
+    ['direction']
+)
+CLIENT_INIT_SECONDS = Histogram(
+    'tbg_client_init_seconds', 'Time to import and initialize a provider client',
+    ['service'], buckets=LATENCY_BUCKETS
+)
+SESSION_STATE_BYTES = Histogram(
+    'tbg_session_state_bytes', 'Serialized size of a session state, sampled on every rerun',
+    buckets=BYTES_BUCKETS
+)
+
+# Id of the request a span belongs to, for correlating span logs
+request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('request_id', default=None)
+
+_collectors_registered = False
+_collectors_lock = threading.Lock()
+
+
+@contextmanager
+def span(stage: str, **attributes: Any) -> Iterator[None]:
+    """
+    Time one stage of a request.
+
+    The duration is recorded in the stage histogram and, when
+    Config.TRACE_SPANS is set, logged together with the request id.
+    """
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_LATENCY.labels(stage).observe(duration)
+        if Config.TRACE_SPANS:
+            details = ' '.join(f"{key}={value}" for key, value in attributes.items())
+            logger.info(
+                "span request=%s stage=%s duration=%.3fs status=%s %s",
+                request_id.get() or '-', stage, duration, status, details
+            )
+
+
+def new_request_id() -> str:
+    """Start a new request for span logging and return its id."""
+    value = uuid.uuid4().hex[:12]
+    request_id.set(value)
+    return value
+
+
+@contextmanager
+def track_provider_call(service: str, model: str) -> Iterator[None]:
+    """Record latency, in-flight count and errors of one provider call."""
+    gauge = PROVIDER_IN_FLIGHT.labels(service)
+    gauge.inc()
+    start = time.perf_counter()
+    try:
+        with span('provider', service=service, model=model):
+            yield
+    except Exception as e:
+        PROVIDER_ERRORS.labels(service, model, type(e).__name__).inc()
+        raise
+    else:
+        PROVIDER_LATENCY.labels(service, model).observe(time.perf_counter() - start)
+    finally:
+        gauge.dec()
+
+
+def observe_session_state(state: Mapping[str, Any]) -> None:
+    """Sample the serialized size of a session state."""
+    try:
+        size = len(pickle.dumps({key: state[key] for key in state}))
+    except Exception:
+        return
+    SESSION_STATE_BYTES.observe(size)
+
+
+class _StatsCollector:
+    """Exposes the statistics the caches, registry, scheduler and router of this process already keep."""
+
+    def collect(self):
+        from api.registry import registry
+        from utils.result_cache import result_cache
+        from utils.scheduler import scheduler
+        from utils.model_stats import model_stats
+
+        registry_stats = registry.stats()
+        saved = CounterMetricFamily(
+            'tbg_client_reuse_saved_seconds', 'Client initialization time saved by reusing clients'
+        )
+        saved.add_metric([], registry_stats['saved_seconds_total'])
+        yield saved
+
+        cache = CounterMetricFamily('tbg_result_cache_events', 'Result cache lookups', labels=['result'])
+        cache_stats = result_cache.stats()
+        for result in ('hits', 'misses', 'coalesced'):
+            cache.add_metric([result], cache_stats[result])
+        yield cache
+
+        waiting = GaugeMetricFamily('tbg_scheduler_waiting', 'Requests waiting for admission', labels=['service'])
+        for service, stats in scheduler.stats().items():
+            waiting.add_metric([service], stats['waiting'])
+        yield waiting
+
+        p95 = GaugeMetricFamily('tbg_model_p95_seconds', 'Rolling p95 latency used for routing', labels=['model'])
+        errors = GaugeMetricFamily('tbg_model_error_rate', 'Rolling error rate used for routing', labels=['model'])
+        for model, stats in model_stats.stats().items():
+            if stats['p95'] is not None:
+                p95.add_metric([model], stats['p95'])
+            errors.add_metric([model], stats['error_rate'])
+        yield p95
+        yield errors
+
+
+def register_collectors() -> None:
+    """Export the component statistics, at most once per process."""
+    global _collectors_registered
+    with _collectors_lock:
+        if not _collectors_registered:
+            REGISTRY.register(_StatsCollector())
+            _collectors_registered = True
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Metrics in the Prometheus text format, with their content type.
+
+    In multiprocess mode the metrics of every app and worker process are
+    merged; the component statistics are those of this process.
+    """
+    if not MULTIPROCESS:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(_StatsCollector())
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead() -> None:
+    """Drop the live gauges of this process from the merged metrics, before it exits."""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,104 @@
+import threading
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+from utils.config import Config
+
+
+class ModelStats:
+    """Rolling latency and outcome window of one model."""
+
+    def __init__(self, window: int):
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Latency percentile of successful calls, None without enough samples."""
+        if len(self.latencies) < Config.ROUTING_MIN_SAMPLES:
+            return None
+        values = sorted(self.latencies)
+        return values[min(len(values) - 1, int(len(values) * q))]
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+
+class ModelStatsTracker:
+    """
+    Process-wide rolling statistics of provider calls per model, used to
+    route requests to the fastest healthy model.
+    """
+
+    def __init__(self, window: int):
+        """
+        Args:
+            window: Number of recent calls kept per model
+        """
+        self.window = window
+        self._stats: Dict[Tuple[str, str], ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, service: str, model_path: str) -> ModelStats:
+        key = (service, model_path)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats.setdefault(key, ModelStats(self.window))
+        return stats
+
+    def record(self, service: str, model_path: str, duration: float, ok: bool) -> None:
+        """Record one finished provider call."""
+        with self._lock:
+            stats = self._get(service, model_path)
+            stats.outcomes.append(ok)
+            if ok:
+                stats.latencies.append(duration)
+
+    def record_censored(self, service: str, model_path: str, elapsed: float) -> None:
+        """
+        Record a provider call cancelled after elapsed seconds, e.g. the loser
+        of a hedged request. Its latency is only known to be longer, so it is
+        kept as a sample when it is at least the current median and would
+        otherwise be missing from the estimate; shorter ones say nothing new.
+        """
+        with self._lock:
+            stats = self._get(service, model_path)
+            median = stats.percentile(0.5)
+            if elapsed >= (Config.ROUTING_DEFAULT_SECONDS if median is None else median):
+                stats.latencies.append(elapsed)
+
+    def percentile(self, service: str, model_path: str, q: float) -> Optional[float]:
+        """Latency percentile of a model, None without enough samples."""
+        with self._lock:
+            return self._get(service, model_path).percentile(q)
+
+    def expected_seconds(self, service: str, model_path: str) -> float:
+        """
+        Expected time to a successful result: the median latency, inflated
+        by the recent error rate since failed calls have to be retried elsewhere.
+        """
+        with self._lock:
+            stats = self._get(service, model_path)
+            median = stats.percentile(0.5)
+            error_rate = stats.error_rate()
+        if median is None:
+            median = Config.ROUTING_DEFAULT_SECONDS
+        return median / max(0.05, 1.0 - error_rate)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get call count, p50 / p95 latency and error rate per model."""
+        with self._lock:
+            return {
+                f"{service}/{model_path}": {
+                    'calls': len(stats.outcomes),
+                    'p50': stats.percentile(0.5),
+                    'p95': stats.percentile(0.95),
+                    'error_rate': stats.error_rate()
+                }
+                for (service, model_path), stats in self._stats.items()
+            }
+
+
+# Shared statistics for the whole process
+model_stats = ModelStatsTracker(Config.ROUTING_WINDOW)
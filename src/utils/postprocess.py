@@ -0,0 +1,93 @@
+import asyncio
+import io
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from utils.config import Config
+
+# Resolution of Teams custom backgrounds and of the thumbnail shown in the Teams picker
+TEAMS_SIZE = (1920, 1080)
+THUMBNAIL_SIZE = (220, 158)
+
+# Pillow encoder name per output format
+ENCODERS = {'jpg': 'JPEG', 'webp': 'WEBP'}
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _encode(image: Image.Image, format: str, quality: int) -> bytes:
+    if format not in ENCODERS:
+        raise ValueError(f"Unsupported Teams background format: {format}, use one of {', '.join(ENCODERS)}")
+    buffer = io.BytesIO()
+    if format == 'jpg':
+        image.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(buffer, ENCODERS[format], quality=quality, method=6)
+    return buffer.getvalue()
+
+
+def make_teams_assets(data: bytes, format: str, quality: int) -> Tuple[bytes, bytes]:
+    """
+    Turn a generated image into a Teams background and its thumbnail.
+
+    The image is scaled and center-cropped to 1920x1080, then encoded
+    as JPEG or WebP together with a 220x158 thumbnail.
+
+    Args:
+        data: Encoded source image
+        format: Output format ("jpg" or "webp")
+        quality: Encoder quality (1-100)
+
+    Returns:
+        (background bytes, thumbnail bytes)
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        image = source.convert('RGB')
+    background = ImageOps.fit(image, TEAMS_SIZE, Image.Resampling.LANCZOS)
+    thumbnail = ImageOps.fit(background, THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+    return _encode(background, format, quality), _encode(thumbnail, format, quality)
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """
+    Get the process pool used for image post-processing.
+
+    Worker processes are spawned rather than forked because the app
+    process runs many threads.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=Config.POSTPROCESS_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+    return _pool
+
+
+def shutdown_pool() -> None:
+    """Stop the post-processing processes, e.g. before a worker process exits."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+async def process_image(data: bytes) -> Tuple[bytes, bytes]:
+    """
+    Create Teams-ready assets for an image off the event loop.
+
+    Output format and quality come from Config.POSTPROCESS_FORMAT and
+    Config.POSTPROCESS_QUALITY.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_pool(), make_teams_assets, data, Config.POSTPROCESS_FORMAT, Config.POSTPROCESS_QUALITY
+    )
@@ -0,0 +1,180 @@
+import asyncio
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from utils.backend import backend as shared_backend
+from utils.config import Config
+
+
+class _LeaderLeft(Exception):
+    """Set on an in-flight call whose leader was cancelled or stopped before it finished."""
+
+
+class ResultCache:
+    """
+    Process-wide cache of generation results with in-flight request coalescing.
+
+    Entries expire after ttl_seconds and the cache holds at most max_entries
+    results (least recently used are dropped first). Identical requests that
+    arrive while the first one is still running share its upstream call,
+    even when they come from different sessions (threads / event loops).
+    If the session running the shared call is cancelled or stopped, one of
+    the waiting requests takes the call over.
+
+    With a shared backend, results are also written to it and looked up
+    there on a local miss, so replicas share each other's hits. Coalescing
+    stays within the process.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int, backend=None):
+        """
+        Initialize the result cache.
+
+        Args:
+            ttl_seconds: Time to live of a cached result
+            max_entries: Maximum number of cached results
+            backend: Shared backend used behind the local entries, if it is shared
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._backend = backend if backend is not None and backend.shared else None
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._in_flight: Dict[str, Future] = {}
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def make_key(service: str, model_path: str, prompt: str, params: Dict[str, Any]) -> str:
+        """
+        Build a canonical cache key from everything that affects the result.
+        """
+        payload = json.dumps(
+            {'service': service, 'model_path': model_path, 'prompt': prompt, 'params': params},
+            sort_keys=True,
+            separators=(',', ':'),
+            default=str
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _get_local(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return copy.deepcopy(value)
+
+    def _set_local(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get a cached value, or None if it is missing or expired."""
+        value = self._get_local(key)
+        if value is not None or self._backend is None:
+            return value
+
+        raw = self._backend.get(f"result:{key}")
+        if raw is None:
+            return None
+        value = json.loads(raw)
+        self._set_local(key, value)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """Cache a value."""
+        self._set_local(key, value)
+        if self._backend is not None:
+            self._backend.set(f"result:{key}", json.dumps(value, default=str), self.ttl_seconds)
+
+    def invalidate(self, key: str) -> None:
+        """Drop a cached value."""
+        with self._lock:
+            self._entries.pop(key, None)
+        if self._backend is not None:
+            self._backend.delete(f"result:{key}")
+
+    async def get_or_compute(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Any]],
+        is_valid: Optional[Callable[[Any], bool]] = None
+    ) -> Any:
+        """
+        Return the cached value for key, or compute it with factory.
+
+        Args:
+            key: Cache key from make_key
+            factory: Coroutine function producing the value on a miss
+            is_valid: Optional check that a cached value is still usable
+        """
+        value = self.get(key)
+        if value is not None and (is_valid is None or is_valid(value)):
+            self.hits += 1
+            return value
+
+        while True:
+            with self._lock:
+                future = self._in_flight.get(key)
+                leader = future is None
+                if leader:
+                    future = Future()
+                    self._in_flight[key] = future
+                    self.misses += 1
+                else:
+                    self.coalesced += 1
+
+            if leader:
+                break
+            try:
+                # Shielded, so a cancelled follower does not cancel the shared call
+                return copy.deepcopy(await asyncio.shield(asyncio.wrap_future(future)))
+            except _LeaderLeft:
+                # The leader's session went away; take over the call with our own factory
+                continue
+
+        try:
+            value = await factory()
+            self.set(key, value)
+        except BaseException as e:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            # Errors of the call are shared. Cancellation, reruns and stops belong to
+            # the leader's session only, so a waiting request takes over instead.
+            future.set_exception(e if isinstance(e, Exception) else _LeaderLeft())
+            raise
+        with self._lock:
+            self._in_flight.pop(key, None)
+        future.set_result(value)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        """Get hit / miss counters and current size."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'entries': len(self._entries),
+            'in_flight': len(self._in_flight)
+        }
+
+
+# Shared cache for the whole process
+result_cache = ResultCache(Config.RESULT_CACHE_TTL, Config.RESULT_CACHE_MAX_ENTRIES, shared_backend)
@@ -0,0 +1,267 @@
+import asyncio
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from utils.backend import backend as shared_backend
+from utils.config import Config
+from utils.executor import run_blocking
+from utils.metrics import span
+
+# Called while waiting with (position in queue, estimated wait in seconds)
+WaitCallback = Callable[[int, float], None]
+
+
+class TokenBucket:
+    """
+    Token bucket limiting the rate of provider calls.
+
+    The bucket state lives in the shared backend, so with a shared backend
+    the rate limit applies to all replicas together.
+    """
+
+    def __init__(self, name: str, rate_per_minute: float, burst: int, backend=None):
+        """
+        Args:
+            name: Bucket name in the backend
+            rate_per_minute: Sustained number of calls per minute
+            burst: Maximum number of calls that can be made at once
+            backend: Backend holding the bucket state, the shared backend by default
+        """
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst)
+        self._backend = backend or shared_backend
+
+    def try_acquire(self) -> bool:
+        """Take a token if one is available."""
+        acquired, _ = self._backend.take_token(self.name, self.rate, self.capacity)
+        return acquired
+
+    def seconds_until_available(self) -> float:
+        """Time until the next token is available."""
+        _, wait = self._backend.take_token(self.name, self.rate, self.capacity, take=False)
+        return wait
+
+
+class ProviderQueue:
+    """
+    Fair FIFO admission queue for one provider.
+
+    Requests are admitted strictly in arrival order when a token is
+    available and fewer than max_in_flight calls are running. Both limits
+    live in the shared backend, so with a shared backend they apply to all
+    replicas and job workers together; the queue order is per process.
+    """
+
+    # Seconds after which the slot of a call is freed if its process died
+    # without releasing it; longer than any provider call
+    SLOT_LEASE_SECONDS = 900.0
+
+    def __init__(self, name: str, rate_per_minute: float, burst: int, max_in_flight: int, backend=None):
+        self.name = name
+        self.bucket = TokenBucket(f"rate:{name}", rate_per_minute, burst, backend)
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._backend = backend or shared_backend
+        self._waiting: deque = deque()
+        self._lock = threading.Lock()
+        self._tickets = itertools.count()
+
+        # Moving average of call duration, used for wait estimates
+        self.average_seconds = 10.0
+
+    def enqueue(self) -> int:
+        """Add a request to the end of the queue and return its ticket."""
+        with self._lock:
+            ticket = next(self._tickets)
+            self._waiting.append(ticket)
+            return ticket
+
+    def remove(self, ticket: int) -> None:
+        """Remove a request that gave up waiting."""
+        with self._lock:
+            try:
+                self._waiting.remove(ticket)
+            except ValueError:
+                pass
+
+    def position(self, ticket: int) -> int:
+        """1-based position of a ticket in the queue, 0 if not waiting."""
+        with self._lock:
+            try:
+                return self._waiting.index(ticket) + 1
+            except ValueError:
+                return 0
+
+    @property
+    def blocking(self) -> bool:
+        """Whether admission checks do I/O and belong off the event loop."""
+        return self._backend.shared
+
+    def try_admit(self, ticket: int) -> Optional[str]:
+        """
+        Admit the ticket if it is first in line and capacity is available.
+
+        Returns:
+            The in-flight slot to pass to release, or None if not admitted
+        """
+        with self._lock:
+            if not self._waiting or self._waiting[0] != ticket:
+                return None
+            slot = self._backend.acquire_slot(f"in_flight:{self.name}", self.max_in_flight, self.SLOT_LEASE_SECONDS)
+            if slot is None:
+                return None
+            if not self.bucket.try_acquire():
+                self._backend.release_slot(f"in_flight:{self.name}", slot)
+                return None
+            self._waiting.popleft()
+            self.in_flight += 1
+            return slot
+
+    def release(self, slot: str, duration: Optional[float] = None) -> None:
+        """
+        Mark an admitted call as finished.
+
+        Args:
+            slot: Slot returned by try_admit
+            duration: Call duration for the wait estimates, None if the call never ran
+        """
+        self._backend.release_slot(f"in_flight:{self.name}", slot)
+        with self._lock:
+            self.in_flight -= 1
+            if duration is not None:
+                self.average_seconds = 0.8 * self.average_seconds + 0.2 * duration
+
+    def estimated_wait(self, position: int) -> float:
+        """Rough wait estimate for a request at the given position."""
+        by_capacity = position * self.average_seconds / max(1, self.max_in_flight)
+        by_rate = position / self.bucket.rate if self.bucket.rate > 0 else 0.0
+        return max(by_capacity, by_rate, self.bucket.seconds_until_available())
+
+
+class Scheduler:
+    """
+    Process-wide scheduler shared by all sessions in front of every provider.
+    """
+
+    # Interval between admission checks while waiting
+    POLL_SECONDS = 0.1
+
+    def __init__(self):
+        self._queues: Dict[str, ProviderQueue] = {}
+        self._lock = threading.Lock()
+
+    def queue(self, service: str) -> ProviderQueue:
+        """Get the admission queue for a provider."""
+        with self._lock:
+            if service not in self._queues:
+                self._queues[service] = ProviderQueue(
+                    service,
+                    rate_per_minute=Config.PROVIDER_RATE_PER_MINUTE.get(service, 60),
+                    burst=Config.PROVIDER_BURST.get(service, 1),
+                    max_in_flight=Config.PROVIDER_MAX_IN_FLIGHT.get(service, 1)
+                )
+            return self._queues[service]
+
+    @asynccontextmanager
+    async def slot(self, service: str, on_wait: Optional[WaitCallback] = None) -> AsyncIterator[None]:
+        """
+        Wait for an admission slot for one provider call.
+
+        Args:
+            service: Provider name
+            on_wait: Called with queue position and estimated wait while queued
+        """
+        queue = self.queue(service)
+        ticket = queue.enqueue()
+        last_position = None
+        try:
+            with span('queue', service=service):
+                while True:
+                    slot = await self._admit(queue, ticket)
+                    if slot is not None:
+                        break
+                    position = queue.position(ticket)
+                    if on_wait is not None and position != last_position:
+                        on_wait(position, await self._call(queue, queue.estimated_wait, position))
+                        last_position = position
+                    await asyncio.sleep(self.POLL_SECONDS)
+        except BaseException:
+            queue.remove(ticket)
+            raise
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            await self._call(queue, queue.release, slot, time.monotonic() - start)
+
+    @staticmethod
+    async def _call(queue: ProviderQueue, func: Callable[..., Any], *args: Any) -> Any:
+        """Call a queue method, in the executor if it talks to a shared backend."""
+        if queue.blocking:
+            return await run_blocking(func, *args)
+        return func(*args)
+
+    async def _admit(self, queue: ProviderQueue, ticket: int) -> Optional[str]:
+        """Try to admit a ticket, releasing the slot again if the caller is cancelled meanwhile."""
+        if not queue.blocking:
+            return queue.try_admit(ticket)
+        attempt = asyncio.ensure_future(run_blocking(queue.try_admit, ticket))
+        try:
+            return await asyncio.shield(attempt)
+        except asyncio.CancelledError:
+            def release_unused(future: asyncio.Future) -> None:
+                if not future.cancelled() and future.exception() is None and future.result() is not None:
+                    asyncio.ensure_future(run_blocking(queue.release, future.result()))
+            attempt.add_done_callback(release_unused)
+            raise
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get queue length and in-flight calls per provider."""
+        with self._lock:
+            queues = list(self._queues.values())
+        return {
+            queue.name: {
+                'waiting': len(queue._waiting),
+                'in_flight': queue.in_flight,
+                'average_seconds': queue.average_seconds
+            }
+            for queue in queues
+        }
+
+
+async def call_with_retries(
+    func: Callable[[], Awaitable[Any]],
+    is_retryable: Callable[[BaseException], bool],
+    max_retries: int,
+    base_delay: float = 1.0,
+    max_delay: float = 30.0
+) -> Any:
+    """
+    Call func, retrying retryable errors with jittered exponential backoff.
+
+    Args:
+        func: Coroutine function performing one attempt
+        is_retryable: Decides whether an error is worth retrying
+        max_retries: Maximum number of retries after the first attempt
+        base_delay: Delay before the first retry
+        max_delay: Upper bound for a single delay
+    """
+    for attempt in itertools.count():
+        try:
+            return await func()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            # Full jitter
+            await asyncio.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+
+
+# Shared scheduler for the whole process
+scheduler = Scheduler()
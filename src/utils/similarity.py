@@ -0,0 +1,200 @@
+import logging
+import re
+import threading
+import zlib
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from utils.config import Config
+from utils.history import history
+
+logger = logging.getLogger(__name__)
+
+# Character n-gram sizes used as features
+NGRAM_SIZES = (3, 4)
+
+# Size of the document frequency table the n-grams are counted in
+DF_BUCKETS = 1 << 20
+
+# History rows indexed between two releases of the lock
+BATCH_SIZE = 1000
+
+# Length of the coarse vectors that preselect candidates for a search
+SKETCH_DIMENSIONS = 64
+
+# Prompts rescored with their full vectors after the coarse pass
+CANDIDATES = 1024
+
+
+def normalize(prompt: str) -> str:
+    """Lower-case words separated by single spaces."""
+    return ' '.join(re.findall(r'\w+', prompt.lower()))
+
+
+def ngram_hashes(text: str) -> np.ndarray:
+    """Hashes of the character n-grams of a normalized prompt, padded with spaces."""
+    text = f" {text} "
+    return np.array([
+        zlib.crc32(text[start:start + size].encode('utf-8'))
+        for size in NGRAM_SIZES
+        for start in range(max(1, len(text) - size + 1))
+    ], dtype=np.uint32)
+
+
+class PromptIndex:
+    """
+    In-memory similarity index over the distinct prompts in the history.
+
+    Prompts are stored as term-frequency weighted character n-gram vectors,
+    hashed with random signs into a fixed number of dimensions (the hashing
+    trick) and normalized. The inverse document frequency is applied to the
+    query instead, from the counts at search time, so every prompt is scored
+    with the same, current weights. A search first compares the query with
+    a short random projection of every prompt, then rescores the best
+    CANDIDATES with their full vectors, kept as float16.
+
+    Each prompt points to its newest history entry. The index follows the
+    history by loading rows added since the last search, including those
+    written by worker processes.
+    """
+
+    def __init__(self, dimensions: int):
+        """
+        Args:
+            dimensions: Length of the hashed vectors
+        """
+        self.dimensions = dimensions
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._vectors = np.zeros((1024, dimensions), dtype=np.float16)
+        self._sketches = np.zeros((1024, SKETCH_DIMENSIONS), dtype=np.float32)
+        # Fixed random projection, roughly preserving dot products
+        self._projection = (
+            np.random.default_rng(0).standard_normal((dimensions, SKETCH_DIMENSIONS)) / np.sqrt(SKETCH_DIMENSIONS)
+        ).astype(np.float32)
+        self._ids = np.zeros(1024, dtype=np.int64)
+        self._rows: Dict[str, int] = {}
+        self._last_id = 0
+        self._document_frequency = np.zeros(DF_BUCKETS, dtype=np.int32)
+        self._warm_up_thread = None
+
+    @property
+    def size(self) -> int:
+        """Number of distinct prompts indexed."""
+        return len(self._rows)
+
+    def _vectorize(self, hashes: np.ndarray, weighted: bool) -> np.ndarray:
+        """
+        Sign-hashed and L2-normalized vector of n-gram hashes, weighted by term
+        frequency and, if weighted, by the current inverse document frequency.
+        """
+        features, counts = np.unique(hashes, return_counts=True)
+        weights = 1 + np.log(counts)
+        if weighted:
+            document_frequency = self._document_frequency[features % DF_BUCKETS]
+            weights *= np.log((1 + self.size) / (1 + document_frequency)) + 1
+        signs = np.where(features & 0x80000000, 1.0, -1.0)
+        vector = np.bincount(
+            features % self.dimensions, weights=signs * weights, minlength=self.dimensions
+        ).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _add(self, entry_id: int, prompt: str) -> None:
+        """Add one history entry. Must hold the lock."""
+        text = normalize(prompt)
+        row = self._rows.get(text)
+        if row is not None:
+            self._ids[row] = entry_id
+            return
+
+        hashes = ngram_hashes(text)
+        np.add.at(self._document_frequency, np.unique(hashes) % DF_BUCKETS, 1)
+
+        row = self.size
+        if row == len(self._ids):
+            self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+            self._sketches = np.concatenate([self._sketches, np.zeros_like(self._sketches)])
+            self._ids = np.concatenate([self._ids, np.zeros_like(self._ids)])
+        vector = self._vectorize(hashes, weighted=False)
+        self._vectors[row] = vector
+        self._sketches[row] = vector @ self._projection
+        self._ids[row] = entry_id
+        self._rows[text] = row
+
+    def refresh(self, blocking: bool = True) -> None:
+        """
+        Index history entries added since the last refresh.
+
+        Args:
+            blocking: False returns at once if another thread is refreshing
+        """
+        if not self._refresh_lock.acquire(blocking):
+            return
+        try:
+            rows = history.since(self._last_id)
+            for start in range(0, len(rows), BATCH_SIZE):
+                with self._lock:
+                    for entry_id, prompt in rows[start:start + BATCH_SIZE]:
+                        self._add(entry_id, prompt)
+            if rows:
+                self._last_id = rows[-1][0]
+                logger.debug("Indexed %d history entries, %d distinct prompts", len(rows), self.size)
+        finally:
+            self._refresh_lock.release()
+
+    def warm_up(self) -> None:
+        """Index the existing history in a background thread, at most once per process."""
+        with self._lock:
+            if self._warm_up_thread is not None:
+                return
+            self._warm_up_thread = threading.Thread(target=self.refresh, name="prompt-index-warm-up", daemon=True)
+            self._warm_up_thread.start()
+
+    def search(self, prompt: str, k: int, min_score: float) -> List[Tuple[int, float]]:
+        """
+        Find the history entries with the most similar prompts.
+
+        Args:
+            prompt: The prompt to compare
+            k: Maximum number of results
+            min_score: Minimum cosine similarity of the weighted query and a prompt
+
+        Returns:
+            (history id, similarity) pairs, most similar first
+        """
+        # While the initial build runs, search what is indexed so far
+        self.refresh(blocking=False)
+        with self._lock:
+            size = self.size
+            vectors, sketches, ids = self._vectors, self._sketches, self._ids
+            query = self._vectorize(ngram_hashes(normalize(prompt)), weighted=True)
+        if size == 0 or k <= 0:
+            return []
+
+        if size > CANDIDATES:
+            coarse = sketches[:size] @ (query @ self._projection)
+            rows = np.argpartition(-coarse, CANDIDATES - 1)[:CANDIDATES]
+        else:
+            rows = np.arange(size)
+        scores = vectors[rows].astype(np.float32) @ query
+        top = np.argsort(-scores)[:k]
+        return [(int(ids[rows[i]]), float(scores[i])) for i in top if scores[i] >= min_score]
+
+
+def find_similar(prompt: str) -> List[Dict[str, Any]]:
+    """
+    Stored images whose prompt is similar to prompt, most similar first.
+
+    Returns:
+        History entries with an added 'similarity'
+    """
+    matches = prompt_index.search(prompt, Config.SIMILARITY_RESULTS, Config.SIMILARITY_MIN_SCORE)
+    scores = dict(matches)
+    entries = history.get([entry_id for entry_id, _ in matches])
+    return [{**entry, 'similarity': scores[entry['id']]} for entry in entries]
+
+
+# Shared index for the whole process
+prompt_index = PromptIndex(Config.SIMILARITY_DIMENSIONS)
@@ -0,0 +1,157 @@
+import argparse
+import asyncio
+import atexit
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from typing import Callable, List, Optional
+
+from utils.config import Config
+from utils.jobs import job_queue
+from api.errors import ProviderError
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[List[multiprocessing.Process]] = None
+_pool_lock = threading.Lock()
+
+# Interval at which each worker deletes finished jobs older than FINISHED_TTL
+PURGE_SECONDS = 3600
+
+
+async def _run_job(job: dict) -> None:
+    """Run one claimed job and store its result in the queue."""
+    # Imported here so the parent app process does not load the providers twice
+    from api.registry import registry
+    from api import generation
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(Config.JOB_HEARTBEAT_SECONDS)
+            await asyncio.to_thread(job_queue.heartbeat, job['id'])
+
+    heartbeat_task = asyncio.ensure_future(heartbeat())
+    try:
+        entries = await generation.generate(
+            registry.get_clients(), job['service'], job['model_path'],
+            job['prompt'], job['params'], job['variant']
+        )
+        await asyncio.to_thread(job_queue.complete, job['id'], entries)
+    except Exception as e:
+        retryable = isinstance(e, ProviderError) and e.retryable
+        logger.warning("Job %s failed: %s", job['id'], e)
+        await asyncio.to_thread(job_queue.fail, job['id'], str(e), retryable)
+    finally:
+        heartbeat_task.cancel()
+
+
+async def serve(concurrency: int) -> None:
+    """
+    Claim and run queued jobs forever, up to concurrency jobs at a time.
+    """
+    from api.registry import registry
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    semaphore = asyncio.Semaphore(concurrency)
+    registry.warm_up()
+    logger.info("Worker %s started", worker_id)
+
+    next_purge = time.monotonic()
+    while True:
+        await semaphore.acquire()
+        if time.monotonic() >= next_purge:
+            purged = await asyncio.to_thread(job_queue.purge)
+            if purged:
+                logger.info("Deleted %d finished jobs", purged)
+            next_purge = time.monotonic() + PURGE_SECONDS
+        await asyncio.to_thread(job_queue.requeue_stale, Config.JOB_HEARTBEAT_SECONDS * 3)
+        job = await asyncio.to_thread(job_queue.claim, worker_id)
+        if job is None:
+            semaphore.release()
+            await asyncio.sleep(Config.JOB_POLL_SECONDS)
+            continue
+
+        task = asyncio.ensure_future(_run_job(job))
+        task.add_done_callback(lambda _: semaphore.release())
+
+
+def run_worker(concurrency: int) -> None:
+    """Entry point of a worker process."""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    from utils.metrics import mark_process_dead
+    from utils.postprocess import shutdown_pool
+
+    # Exit normally on terminate, so the post-processing pool is shut down with the worker
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        asyncio.run(serve(concurrency))
+    finally:
+        shutdown_pool()
+        mark_process_dead()
+
+
+def start_worker_pool(processes: int, concurrency: int, target: Callable[[int], None] = run_worker) -> None:
+    """
+    Start the worker processes, at most once per app process.
+
+    Workers are not daemonic, since they start their own post-processing
+    pool; they are terminated when the app process exits.
+
+    Args:
+        processes: Number of worker processes
+        concurrency: Jobs each process runs at the same time
+        target: Entry point of each process, run_worker by default
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            return
+        context = multiprocessing.get_context('spawn')
+        _pool = [
+            context.Process(target=target, args=(concurrency,), name=f"generation-worker-{n}")
+            for n in range(processes)
+        ]
+        for process in _pool:
+            process.start()
+        atexit.register(stop_worker_pool)
+
+
+def stop_worker_pool(timeout: float = 10.0) -> None:
+    """Terminate the worker processes started by start_worker_pool and wait for them."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    for process in pool or []:
+        if process.is_alive():
+            process.terminate()
+    for process in pool or []:
+        process.join(timeout)
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run generation workers for the job queue")
+    parser.add_argument('--processes', '-p', type=int, default=Config.JOB_WORKERS, help="Number of worker processes")
+    parser.add_argument('--concurrency', '-c', type=int, default=Config.JOB_WORKER_CONCURRENCY,
+                        help="Jobs each process runs at the same time")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        run_worker(args.concurrency)
+        return 0
+
+    start_worker_pool(args.processes, args.concurrency)
+    for process in list(_pool):
+        process.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
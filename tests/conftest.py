@@ -0,0 +1,28 @@
+import base64
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = tempfile.mkdtemp(prefix='tbg-tests-')
+
+# Keep the tests out of the real stores and away from real providers; must be
+# set before Config is imported. Spawned worker processes inherit both.
+os.environ.update({
+    'JOB_DB_PATH': os.path.join(DATA_DIR, 'jobs.sqlite3'),
+    'HISTORY_DB_PATH': os.path.join(DATA_DIR, 'history.sqlite3'),
+    'IMAGE_STORE_DIR': os.path.join(DATA_DIR, 'images'),
+    'SHARED_BACKEND': 'memory',
+    'WARM_UP_PROVIDERS': 'false',
+    'JOB_POLL_SECONDS': '0.1',
+    'POSTPROCESS_WORKERS': '1',
+    'REPLICATE_API_TOKEN': 'test',
+    'GOOGLE_PROJECT_ID': 'test',
+    'GOOGLE_CREDENTIALS_BASE64': base64.b64encode(b'{}').decode('ascii'),
+    'REPLICATE_RATE_PER_MINUTE': '1000000',
+    'REPLICATE_BURST': '1000',
+})
+os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
@@ -0,0 +1,51 @@
+import pytest
+
+from fakes import LatencyModel, install
+from api.health import readiness
+from api.registry import registry
+
+
+@pytest.fixture
+def fake_providers():
+    uninstall = install(LatencyModel(0), LatencyModel(0), LatencyModel(0))
+    yield
+    uninstall()
+
+
+def test_readiness_follows_warm_up_without_loading_clients(fake_providers):
+    try:
+        registry.invalidate()
+        ready, details = readiness()
+        assert not ready
+        assert details['providers']['vertex'] == {'loaded': False, 'connected': False}
+        assert registry.loaded_client('vertex') is None
+        assert registry.startup_report() == {}
+
+        # Creating the client loads only the first model handle
+        vertex = registry.get_client('vertex')
+        registry.get_client('replicate')
+        ready, details = readiness()
+        assert not ready
+        assert details['providers']['vertex']['models'] == {
+            'imagen-3.0-generate-001': True, 'imagen-3.0-fast-generate-001': False
+        }
+
+        vertex.warm_up()
+        ready, details = readiness()
+        assert ready, details
+
+        registry.invalidate()
+        assert registry.startup_report() == {}
+        assert not readiness()[0]
+    finally:
+        registry.invalidate()
+
+
+def test_uninstall_restores_the_sdk_loaders():
+    from api.replicate import ReplicateClient
+
+    load_sdk = ReplicateClient.load_sdk
+    uninstall = install(LatencyModel(0), LatencyModel(0), LatencyModel(0))
+    assert ReplicateClient.load_sdk is not load_sdk
+    uninstall()
+    assert ReplicateClient.load_sdk is load_sdk
@@ -0,0 +1,68 @@
+import asyncio
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from fakes import FakeReplicateClient, LatencyModel, StubImageServer
+from api.errors import ProviderError, is_retryable_error
+from api.replicate import ReplicateClient
+from utils.config import Config
+from utils.http import download_image
+
+
+@pytest.fixture
+def slow_once_server():
+    """Serves a small image, stalling the first request past the read timeout."""
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_seen.append(self.path)
+            if len(requests_seen) == 1:
+                time.sleep(0.5)
+            self.send_response(200)
+            self.send_header('Content-Length', '5')
+            self.end_headers()
+            self.wfile.write(b'image')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/image.png", requests_seen
+    server.shutdown()
+
+
+def test_download_retries_timeouts_itself(slow_once_server, monkeypatch):
+    url, requests_seen = slow_once_server
+    monkeypatch.setattr(Config, 'HTTP_READ_TIMEOUT', 0.2)
+    assert download_image(url) == b'image'
+    assert len(requests_seen) == 2
+
+
+def test_failed_download_does_not_retry_the_generation(monkeypatch):
+    # Every download fails, but the prediction itself succeeds
+    server = StubImageServer(b'image', LatencyModel(0, error_rate=1.0)).start()
+    predictions = []
+
+    def make_client(api_token=None):
+        client = FakeReplicateClient(server, LatencyModel(0), api_token)
+        create = client.models.predictions.create
+        client.models.predictions.create = lambda **kwargs: predictions.append(kwargs) or create(**kwargs)
+        return client
+
+    monkeypatch.setattr(ReplicateClient, 'load_sdk', staticmethod(lambda: types.SimpleNamespace(Client=make_client)))
+    monkeypatch.setattr(Config, 'HTTP_RETRIES', 0)
+    monkeypatch.setattr(Config, 'REPLICATE_POLL_MIN_SECONDS', 0.01)
+    try:
+        client = ReplicateClient('test')
+        with pytest.raises(ProviderError) as error:
+            asyncio.run(client.generate_image("a lake", "black-forest-labs/flux-schnell-lora"))
+    finally:
+        server.stop()
+    assert not is_retryable_error(error.value)
+    assert len(predictions) == 1
@@ -0,0 +1,33 @@
+import os
+
+from utils.image_store import ImageStore
+
+
+def disk_bytes(root):
+    return sum(
+        os.path.getsize(os.path.join(dirpath, filename))
+        for dirpath, _, filenames in os.walk(root)
+        for filename in filenames
+    )
+
+
+def test_size_limit_holds_across_processes_sharing_a_directory(tmp_path):
+    # Two stores on one directory stand in for the app process and a worker
+    limit = 100_000
+    stores = [ImageStore(str(tmp_path), limit), ImageStore(str(tmp_path), limit)]
+    for n in range(200):
+        stores[n % 2].put(os.urandom(1000) + n.to_bytes(4, 'big'), 'png')
+
+    # Each writer may be up to one rescan interval behind the other
+    assert disk_bytes(tmp_path) <= limit * 1.2 + 2 * 1004
+
+
+def test_recently_used_images_survive_eviction_by_another_process(tmp_path):
+    limit = 50_000
+    app, worker = ImageStore(str(tmp_path), limit), ImageStore(str(tmp_path), limit)
+    kept = app.put(os.urandom(1000), 'png')
+    for n in range(200):
+        worker.put(os.urandom(1000), 'png')
+        if n % 10 == 0:
+            assert app.path(kept) is not None
+    assert worker.exists(kept)
@@ -0,0 +1,34 @@
+from utils.jobs import CANCELLED_ERROR, DONE, FAILED, QUEUED, RUNNING, JobQueue
+
+
+def test_cancel_fails_only_unclaimed_jobs(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'))
+    running = queue.submit('replicate', 'model', 'a lake', {})
+    queued = queue.submit('replicate', 'model', 'a lake', {}, variant=1)
+    assert queue.claim('worker')['id'] == running
+
+    queue.cancel([running, queued])
+    jobs = {job['id']: job for job in queue.get([running, queued])}
+    assert jobs[running]['status'] == RUNNING
+    assert jobs[queued]['status'] == FAILED
+    assert jobs[queued]['error'] == CANCELLED_ERROR
+    assert queue.claim('worker') is None
+
+    queue.complete(running, [])
+    assert queue.get([running])[0]['status'] == DONE
+    assert QUEUED not in queue.counts()
+
+
+def test_purge_deletes_only_old_finished_jobs(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'))
+    done = queue.submit('replicate', 'model', 'a lake', {})
+    queue.claim('worker')
+    queue.complete(done, [])
+    failed = queue.submit('replicate', 'model', 'a lake', {}, variant=1)
+    queue.cancel([failed])
+    queued = queue.submit('replicate', 'model', 'a lake', {}, variant=2)
+
+    assert queue.purge() == 0
+    assert queue.purge(older_than=0) == 2
+    assert [job['id'] for job in queue.get([done, failed, queued])] == [queued]
+    assert queue.counts() == {QUEUED: 1}
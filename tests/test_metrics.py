@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+
+def test_worker_metrics_are_merged_into_app_metrics(tmp_path):
+    # Multiprocess mode is chosen when prometheus_client is imported, so it runs in a fresh interpreter
+    script = textwrap.dedent("""
+        import multiprocessing
+        import sys
+
+        sys.path.insert(0, sys.argv[1])
+        from utils import metrics
+
+
+        def worker_call():
+            from utils.metrics import BYTES_TRANSFERRED, mark_process_dead
+            BYTES_TRANSFERRED.labels('provider').inc(1000)
+            mark_process_dead()
+
+
+        if __name__ == '__main__':
+            assert metrics.MULTIPROCESS
+            process = multiprocessing.get_context('spawn').Process(target=worker_call)
+            process.start()
+            process.join()
+            metrics.BYTES_TRANSFERRED.labels('provider').inc(500)
+            body, _ = metrics.render_metrics()
+            print(body.decode())
+    """)
+    path = tmp_path / 'metrics_check.py'
+    path.write_text(script)
+    env = {**os.environ, 'JOB_QUEUE_ENABLED': 'true'}
+    env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    output = subprocess.run(
+        [sys.executable, str(path), SRC], env=env, capture_output=True, text=True, check=True
+    ).stdout
+    assert 'tbg_bytes_total{direction="provider"} 1500.0' in output
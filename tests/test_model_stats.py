@@ -0,0 +1,17 @@
+from utils.model_stats import ModelStatsTracker
+
+
+def test_censored_calls_raise_a_slow_model_estimate():
+    tracker = ModelStatsTracker(window=20)
+    for _ in range(5):
+        tracker.record('replicate', 'model', 2.0, ok=True)
+    assert tracker.expected_seconds('replicate', 'model') == 2.0
+
+    # A hedge loser cancelled before the median carries no new information
+    tracker.record_censored('replicate', 'model', 0.5)
+    assert tracker.percentile('replicate', 'model', 0.5) == 2.0
+
+    # Calls cancelled after waiting longer than usual push the estimate up
+    for _ in range(6):
+        tracker.record_censored('replicate', 'model', 30.0)
+    assert tracker.expected_seconds('replicate', 'model') == 30.0
@@ -0,0 +1,23 @@
+import io
+
+import pytest
+from PIL import Image
+
+from utils.postprocess import THUMBNAIL_SIZE, TEAMS_SIZE, make_teams_assets
+
+
+def png(size):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'navy').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def test_teams_assets_are_cropped_to_teams_sizes():
+    background, thumbnail = make_teams_assets(png((768, 1024)), 'webp', 80)
+    assert Image.open(io.BytesIO(background)).size == TEAMS_SIZE
+    assert Image.open(io.BytesIO(thumbnail)).size == THUMBNAIL_SIZE
+
+
+def test_unsupported_format_is_rejected():
+    with pytest.raises(ValueError, match='png'):
+        make_teams_assets(png((64, 64)), 'png', 80)
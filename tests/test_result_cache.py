@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from utils.result_cache import ResultCache
+
+
+class StopSession(BaseException):
+    """Stands in for the exceptions Streamlit raises to stop or rerun a script."""
+
+
+def test_follower_takes_over_when_leader_stops():
+    cache = ResultCache(60, 10)
+    started = asyncio.Event()
+
+    async def stopped():
+        started.set()
+        await asyncio.sleep(0.05)
+        raise StopSession()
+
+    async def computed():
+        return ['image']
+
+    async def main():
+        leader = asyncio.ensure_future(cache.get_or_compute('key', stopped))
+        await started.wait()
+        follower = asyncio.ensure_future(cache.get_or_compute('key', computed))
+        with pytest.raises(StopSession):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == ['image']
+    assert cache.stats()['misses'] == 2
+
+
+def test_follower_survives_cancelled_leader_and_shares_errors():
+    cache = ResultCache(60, 10)
+    started = asyncio.Event()
+
+    async def slow():
+        started.set()
+        await asyncio.sleep(10)
+
+    async def failing():
+        started.set()
+        await asyncio.sleep(0.05)
+        raise ValueError("provider error")
+
+    async def main():
+        leader = asyncio.ensure_future(cache.get_or_compute('a', slow))
+        await started.wait()
+        follower = asyncio.ensure_future(cache.get_or_compute('a', failing))
+        await asyncio.sleep(0)
+        leader.cancel()
+        # The follower becomes the leader; its error reaches its own waiters
+        started.clear()
+        with pytest.raises(ValueError):
+            await follower
+
+        first = asyncio.ensure_future(cache.get_or_compute('b', failing))
+        await started.wait()
+        second = asyncio.ensure_future(cache.get_or_compute('b', failing))
+        results = await asyncio.gather(first, second, return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert cache.stats()['in_flight'] == 0
+
+    asyncio.run(main())
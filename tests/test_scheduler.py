@@ -0,0 +1,39 @@
+import asyncio
+
+from utils.backend import FileBackend
+from utils.scheduler import ProviderQueue, Scheduler
+
+
+def test_in_flight_limit_is_shared_through_the_backend(tmp_path):
+    # Two queues on one file backend stand in for the app and a job worker
+    backend = FileBackend(str(tmp_path / 'shared.sqlite3'))
+    app = ProviderQueue('replicate', 6000, 10, max_in_flight=2, backend=backend)
+    worker = ProviderQueue('replicate', 6000, 10, max_in_flight=2, backend=backend)
+
+    first = app.try_admit(app.enqueue())
+    second = worker.try_admit(worker.enqueue())
+    assert first and second
+    ticket = worker.enqueue()
+    assert worker.try_admit(ticket) is None
+
+    app.release(first, 1.0)
+    assert worker.try_admit(ticket) is not None
+
+
+def test_slot_admits_and_releases_with_a_shared_backend(tmp_path):
+    backend = FileBackend(str(tmp_path / 'shared.sqlite3'))
+    scheduler = Scheduler()
+    scheduler._queues['replicate'] = ProviderQueue('replicate', 6000, 10, max_in_flight=1, backend=backend)
+    waits = []
+
+    async def call():
+        async with scheduler.slot('replicate', lambda position, wait: waits.append(position)):
+            await asyncio.sleep(0.05)
+
+    async def main():
+        await asyncio.gather(call(), call())
+
+    asyncio.run(main())
+    assert waits == [1]
+    assert scheduler.stats()['replicate']['in_flight'] == 0
+    assert backend.acquire_slot('in_flight:replicate', 1, 60) is not None
@@ -0,0 +1,35 @@
+import pytest
+
+from utils.similarity import PromptIndex
+
+PROMPTS = [
+    "modern office, natural light",
+    "tropical beach at sunset",
+    "snowy mountain cabin interior",
+    "cozy library with bookshelves",
+    "futuristic city skyline at night",
+]
+
+
+def build(prompts):
+    index = PromptIndex(256)
+    with index._lock:
+        for entry_id, prompt in prompts:
+            index._add(entry_id, prompt)
+    return index
+
+
+def test_scores_do_not_depend_on_insertion_order():
+    entries = list(enumerate(PROMPTS, start=1))
+    forward = dict(build(entries).search("bright modern office space", 5, 0.0))
+    backward = dict(build(entries[::-1]).search("bright modern office space", 5, 0.0))
+    assert forward.keys() == backward.keys()
+    for entry_id, score in forward.items():
+        assert backward[entry_id] == pytest.approx(score, abs=1e-6)
+
+
+def test_similar_prompts_rank_first():
+    index = build(enumerate(PROMPTS, start=1))
+    matches = index.search("bright modern office space", 4, 0.35)
+    assert [entry_id for entry_id, _ in matches] == [1]
+    assert index.search("beach sunset", 1, 0.35)[0][0] == 2
@@ -0,0 +1,40 @@
+import time
+
+from utils.jobs import DONE, job_queue
+from utils.image_store import image_store
+import worker
+
+
+def run_fake_worker(concurrency: int) -> None:
+    """Worker entry point that talks to the benchmark fakes instead of the providers."""
+    from fakes import LatencyModel, install
+
+    install(LatencyModel(0.05), LatencyModel(0.05), LatencyModel(0.01))
+    worker.run_worker(concurrency)
+
+
+def test_worker_pool_runs_job_end_to_end():
+    job_id = job_queue.submit(
+        'replicate', 'black-forest-labs/flux-schnell-lora', 'a calm lake at dawn',
+        {'aspect_ratio': '16:9', 'output_format': 'png'}
+    )
+    worker.start_worker_pool(1, 1, target=run_fake_worker)
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            (job,) = job_queue.get([job_id])
+            if job['status'] == DONE or job.get('error') or time.monotonic() > deadline:
+                break
+            time.sleep(0.2)
+    finally:
+        processes = list(worker._pool)
+        worker.stop_worker_pool()
+
+    assert job['status'] == DONE, job
+    (entry,) = job['result']
+    assert entry['service'] == 'replicate'
+    assert image_store.exists(entry['key'])
+    assert image_store.exists(entry['teams_key'])
+    assert image_store.exists(entry['thumb_key'])
+    assert worker._pool is None
+    assert not any(process.is_alive() for process in processes)